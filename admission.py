@@ -0,0 +1,206 @@
+import os
+import time
+import math
+import asyncio
+import threading
+from collections import deque, OrderedDict
+import metrics
+
+# Admission control for upstream OpenAI completions.
+#
+# At most ADMISSION_MAX_CONCURRENCY completions run at once per process. Requests beyond
+# that wait in a FIFO queue of ADMISSION_QUEUE_SIZE for up to ADMISSION_QUEUE_TIMEOUT
+# seconds; when the queue is full or the wait times out the request is rejected right
+# away (503 + Retry-After) instead of piling onto OpenAI and failing slowly. Optionally
+# each client is also limited by a token bucket (CLIENT_RATE_LIMIT requests per second,
+# bursts of CLIENT_RATE_BURST), answered with 429 + Retry-After.
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 16))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 32))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 2.0))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 2))
+CLIENT_RATE_LIMIT = float(os.getenv("CLIENT_RATE_LIMIT", 0))  # requests per second per client, 0 disables
+CLIENT_RATE_BURST = float(os.getenv("CLIENT_RATE_BURST", 5))
+CLIENT_RATE_MAX_CLIENTS = int(os.getenv("CLIENT_RATE_MAX_CLIENTS", 10000))
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on App Service); 0 ignores the header
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after, status=503):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+    def body(self):
+        if self.status == 429:
+            return {"detail": "Too many requests, please slow down"}
+        return {"detail": "Server is busy, please try again shortly"}
+
+    def headers(self):
+        return {"Retry-After": str(self.retry_after)}
+
+
+class Permit:
+    """A granted completion slot; release() is idempotent so it can be wired to several exit paths."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release()
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def set(self):
+        self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency=ADMISSION_MAX_CONCURRENCY, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, retry_after=ADMISSION_RETRY_AFTER):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _update_gauges(self):
+        metrics.admission_active.set(self.active)
+        metrics.admission_queue_depth.set(len(self._waiters))
+
+    def _reject(self, reason):
+        metrics.admission_rejected_total.inc(reason=reason)
+        return Rejected(reason, self.retry_after)
+
+    def _enqueue(self, waiter):
+        """Grant a slot immediately (returns None) or queue waiter (returns it); raises when full."""
+        with self._lock:
+            if self.active < self.max_concurrency and not self._waiters:
+                self.active += 1
+                self._update_gauges()
+                return None
+            if len(self._waiters) >= self.queue_size:
+                raise self._reject("queue_full")
+            self._waiters.append(waiter)
+            self._update_gauges()
+            return waiter
+
+    def _abandon(self, waiter):
+        """Called when a waiter gives up; returns False if it was granted a slot meanwhile."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            self._update_gauges()
+            return True
+
+    def _release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter
+                self._waiters.popleft().set()
+            else:
+                self.active -= 1
+            self._update_gauges()
+
+    def load(self):
+        """Fraction of the slots in use; above 1 while requests are queued."""
+        with self._lock:
+            return (self.active + len(self._waiters)) / self.max_concurrency
+
+    def acquire(self, timeout=None):
+        """Block until a completion slot is free; returns a Permit or raises Rejected."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        waiter = self._enqueue(threading.Event())
+        if waiter is not None and not waiter.wait(timeout) and self._abandon(waiter):
+            metrics.admission_wait_seconds.observe(time.perf_counter() - start)
+            raise self._reject("queue_timeout")
+        metrics.admission_wait_seconds.observe(time.perf_counter() - start)
+        return Permit(self)
+
+    async def acquire_async(self, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        waiter = self._enqueue(_AsyncWaiter())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    metrics.admission_wait_seconds.observe(time.perf_counter() - start)
+                    raise self._reject("queue_timeout")
+            except asyncio.CancelledError:
+                # Client went away while queued; give back the slot if it was already handed over
+                if not self._abandon(waiter):
+                    self._release()
+                raise
+        metrics.admission_wait_seconds.observe(time.perf_counter() - start)
+        return Permit(self)
+
+
+class ClientRateLimiter:
+    """Per-client token buckets, keeping the CLIENT_RATE_MAX_CLIENTS most recently seen clients."""
+
+    def __init__(self, rate=CLIENT_RATE_LIMIT, burst=CLIENT_RATE_BURST, max_clients=CLIENT_RATE_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def check(self, client):
+        """Take one token for client or raise Rejected (429)."""
+        if self.rate <= 0 or not client:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            metrics.admission_rejected_total.inc(reason="rate_limited")
+            raise Rejected("rate_limited", max(1, math.ceil((1 - tokens) / self.rate)), status=429)
+
+
+def client_id(headers, remote_addr, trusted_hops=TRUSTED_PROXY_HOPS):
+    """
+    The caller's address. Each trusted proxy appends the address it received the request from
+    to X-Forwarded-For, so the client is the entry trusted_hops from the end; anything before
+    it was sent by the client and can't be trusted.
+    """
+    forwarded = headers.get("X-Forwarded-For")
+    if trusted_hops <= 0 or not forwarded:
+        return remote_addr
+    entries = [entry.strip() for entry in forwarded.split(",") if entry.strip()]
+    if not entries:
+        return remote_addr
+    client = entries[-min(trusted_hops, len(entries))]
+    if client.count(":") == 1:  # IPv4 with port
+        client = client.split(":")[0]
+    return client
+
+
+completion_slots = AdmissionController()
+client_rate_limiter = ClientRateLimiter()
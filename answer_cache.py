@@ -0,0 +1,108 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Semantic answer cache for /query.
+#
+# An answer is reused when a new query's embedding is within ANSWER_CACHE_THRESHOLD cosine
+# similarity of a cached query, the conversation history matches, and the index has not
+# been re-ingested since the answer was generated (tracked through the index version stamp).
+# MiniLM barely tells "CS 171" from "CS 172" or one CRN from another, so the course codes
+# and numbers in the two queries must also match exactly.
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.97))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 6 * 60 * 60))
+
+_EXACT_TERMS = re.compile(r"\b[a-z]{2,4}[ -]?\d{3}\b|\d+", re.IGNORECASE)
+
+
+def history_key(reformatted_chat):
+    """Hash of the normalized conversation history; empty history maps to ''."""
+    normalized = re.sub(r"\s+", " ", reformatted_chat or "").strip().casefold()
+    if not normalized:
+        return ""
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def exact_terms(query):
+    """Course codes ("CS171"), course numbers and CRNs in the query, which a cache hit must match exactly."""
+    return frozenset(re.sub(r"[ -]", "", term).upper() for term in _EXACT_TERMS.findall(query or ""))
+
+
+class AnswerCache:
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, dimension=384):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._vectors = np.zeros((max_size, dimension), dtype=np.float32)
+        self._entries = OrderedDict()  # slot -> (history_key, created_at, answer, exact_terms)
+        self._free_slots = list(range(max_size - 1, -1, -1))
+        self._index_version = None
+        self._lock = threading.Lock()
+
+    def _invalidate_if_stale(self, index_version):
+        if index_version != self._index_version:
+            self._entries.clear()
+            self._free_slots = list(range(self.max_size - 1, -1, -1))
+            self._index_version = index_version
+
+    def lookup(self, query_vector, reformatted_chat, index_version, terms=frozenset()):
+        """Return a cached answer for a semantically equivalent query with the same exact_terms(), or None."""
+        query_vector = _normalize(query_vector)
+        key = history_key(reformatted_chat)
+        now = time.time()
+        with self._lock:
+            self._invalidate_if_stale(index_version)
+            candidates = [slot for slot, entry in self._entries.items()
+                          if entry[0] == key and entry[3] == terms and now - entry[1] <= self.ttl]
+            if candidates:
+                similarities = self._vectors[candidates] @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    slot = candidates[best]
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return self._entries[slot][2]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, reformatted_chat, index_version, terms, answer):
+        if not answer:
+            return
+        query_vector = _normalize(query_vector)
+        with self._lock:
+            self._invalidate_if_stale(index_version)
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            self._vectors[slot] = query_vector
+            self._entries[slot] = (history_key(reformatted_chat), time.time(), answer, terms)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "index_version": self._index_version}
+
+
+def replay_answer(answer, chunk_words=4):
+    """Yield a cached answer in small pieces so clients see the same streaming behaviour."""
+    pieces = re.findall(r"\S+\s*|\s+", answer)
+    for i in range(0, len(pieces), chunk_words):
+        yield "".join(pieces[i:i + chunk_words])
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+answer_cache = AnswerCache()
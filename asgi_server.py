@@ -0,0 +1,210 @@
+import os
+import asyncio
+from openai import AsyncOpenAI
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from answer_cache import answer_cache, replay_answer
+from admission import completion_slots, client_rate_limiter, client_id, Rejected, ADMISSION_ENABLED
+from completion_dispatcher import AsyncCompletionDispatcher, LLM_FALLBACK_BASE_URL, LLM_FALLBACK_API_KEY
+from single_flight import query_flights, coalescing_key
+import lifecycle
+import metrics
+import server
+
+# Async serving mode: the same routes and response formats as server.py, served over ASGI.
+#
+# Embedding and vector lookups run in the threadpool and OpenAI tokens are streamed on the
+# event loop with AsyncOpenAI, so a single process can hold many concurrent streams.
+#
+# Run with: uvicorn asgi_server:app --host 0.0.0.0 --port 8080
+
+aclient = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+afallback_client = None
+if LLM_FALLBACK_BASE_URL:
+    afallback_client = AsyncOpenAI(api_key=LLM_FALLBACK_API_KEY or os.environ["OPENAI_API_KEY"], base_url=LLM_FALLBACK_BASE_URL)
+completions = AsyncCompletionDispatcher(aclient, afallback_client, can_hedge=server.hedge_allowed)
+
+TEXT_STREAM_HEADERS = {"content-type": "text/plain-text"}
+
+# Leader streams of coalesced /query requests (single_flight.py); held so they aren't garbage collected
+_flight_tasks = set()
+
+
+async def stream_completion(messages, timer=None):
+    stream = await aclient.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if timer is not None:
+                timer.token()
+            yield chunk.choices[0].delta.content
+
+
+async def test(request):
+    return HTMLResponse("Server is running")
+
+
+async def ready(request):
+    is_ready, body = lifecycle.readiness()
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+async def get_metrics(request):
+    return Response(metrics.render_metrics(), headers={"content-type": metrics.CONTENT_TYPE})
+
+
+async def lead_flight(flight, messages, cache_key, permit=None):
+    full_content = ""
+    try:
+        async for content in completions.stream(messages):
+            full_content += content
+            flight.publish(content)
+    except Exception as e:
+        print(e)
+        flight.finish(str(e))
+        return
+    finally:
+        if permit is not None:
+            permit.release()
+    flight.finish()
+    if cache_key is not None:
+        answer_cache.store(*cache_key, full_content)
+
+
+async def follow_flight(flight, timer, success_outcome="coalesced"):
+    timer.stream_started()
+    outcome = "error"
+    try:
+        async for content in flight.afollow():
+            timer.token()
+            yield content
+        outcome = success_outcome
+    finally:
+        timer.finish(outcome)
+
+
+async def query_llm(request):
+    timer = metrics.QueryTimer()
+    flight = None
+    permit = None
+    try:
+        client_rate_limiter.check(client_id(request.headers, request.client.host if request.client else None))
+        data = await request.json()
+        query = data.get("query")
+
+        priorConversation = data.get("priorConversation")
+        with timer.stage("chat_reformat"):
+            reformatted_chat = server.reformat_chat_data(priorConversation)
+
+        if not query:
+            timer.finish("bad_request")
+            return JSONResponse({"detail": "Query is required"}, status_code=400)
+
+        flight_key = coalescing_key(query, priorConversation)
+        if flight_key is not None:
+            flight, is_leader = query_flights.join(flight_key)
+            if not is_leader:
+                return StreamingResponse(follow_flight(flight, timer), headers=TEXT_STREAM_HEADERS)
+
+        with timer.stage("answer_cache_lookup"):
+            cached_answer, cache_key = await run_in_threadpool(server.lookup_cached_answer, query, reformatted_chat)
+        if cached_answer is not None:
+            timer.finish("cache_hit")
+            if flight is not None:
+                flight.publish(cached_answer)
+                flight.finish()
+            return StreamingResponse(replay_answer(cached_answer), headers=TEXT_STREAM_HEADERS)
+
+        if ADMISSION_ENABLED:
+            with timer.stage("admission_wait"):
+                permit = await completion_slots.acquire_async()
+        messages = await run_in_threadpool(server.build_query_messages, query, reformatted_chat, timer)
+
+        if flight is not None:
+            # The completion runs as its own task so followers are served even if this client disconnects
+            task = asyncio.create_task(lead_flight(flight, messages, cache_key, permit))
+            _flight_tasks.add(task)
+            task.add_done_callback(_flight_tasks.discard)
+            return StreamingResponse(follow_flight(flight, timer, "ok"), headers=TEXT_STREAM_HEADERS)
+
+        async def generate():
+            full_content = ""
+            timer.stream_started()
+            outcome = "error"
+            try:
+                async for content in completions.stream(messages):
+                    timer.token()
+                    full_content += content
+                    yield content
+                outcome = "ok"
+            finally:
+                timer.finish(outcome)
+                # Starlette only runs the background task after a clean stream; upstream errors end up here
+                if permit is not None:
+                    permit.release()
+            if cache_key is not None:
+                answer_cache.store(*cache_key, full_content)
+
+        return StreamingResponse(generate(), headers=TEXT_STREAM_HEADERS,
+                                 background=BackgroundTask(permit.release) if permit is not None else None)
+
+    except Rejected as e:
+        timer.finish(e.reason)
+        if flight is not None:
+            flight.finish(e.reason)
+        return JSONResponse(e.body(), status_code=e.status, headers=e.headers())
+    except Exception as e:
+        print(e)
+        timer.finish("error")
+        if permit is not None:
+            permit.release()
+        if flight is not None:
+            flight.finish(str(e))
+        return JSONResponse({"answer": str(e)}, status_code=500)
+
+
+async def summarize_convo(request):
+    firstMessage = (await request.json())["message"]
+    response = await aclient.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=server.summarize_messages(firstMessage)
+    )
+    return JSONResponse({"messageSummary": response.choices[0].message.content})
+
+
+async def query_blackboard(request):
+    return StreamingResponse(stream_completion(server.blackboard_messages()), headers=TEXT_STREAM_HEADERS)
+
+
+app = Starlette(
+    debug=os.getenv("DEBUG_FLASK", "false").lower() in ("1", "true"),
+    routes=[
+        Route("/", test),
+        Route("/ready", ready),
+        Route("/metrics", get_metrics),
+        Route("/query", query_llm, methods=["POST"]),
+        Route("/summarize-convo", summarize_convo, methods=["POST"]),
+        Route("/blackboard", query_blackboard, methods=["POST"]),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["http://localhost:3000", "https://drexelai.github.io"],
+            allow_methods=["*"],
+            allow_headers=["*"]
+        )
+    ]
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,30 @@
+import os
+import sys
+import argparse
+
+# Builds a local vector store snapshot (and BM25 index) from the catalog data checked into
+# the repo, so benchmarks run against VECTOR_STORE=local instead of Pinecone.
+#
+# Usage: python benchmarks/build_snapshot.py [--output benchmarks/snapshot]
+
+DEFAULT_SNAPSHOT_DIR = os.path.join("benchmarks", "snapshot")
+CATALOG_DATA_DIR = os.path.join("data_collection", "tools", "drexel_catalog", "data")
+
+
+def build_snapshot(output_dir=DEFAULT_SNAPSHOT_DIR):
+    # vector_store reads these at import time
+    os.environ["VECTOR_STORE"] = "local"
+    os.environ["LOCAL_INDEX_DIR"] = output_dir
+    sys.path.append('./')
+    from data_collection.tools import data_manager
+
+    data_manager.upload_college_info_to_index(os.path.join(CATALOG_DATA_DIR, "college_info.json"))
+    data_manager.upload_majors_to_index(os.path.join(CATALOG_DATA_DIR, "majors_data.json"))
+    data_manager.upload_minors_to_index(os.path.join(CATALOG_DATA_DIR, "minors_data.json"))
+    data_manager.upload_graduate_programs_to_index(os.path.join(CATALOG_DATA_DIR, "graduate_programs.json"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local index snapshot for benchmarks")
+    parser.add_argument("--output", default=DEFAULT_SNAPSHOT_DIR)
+    build_snapshot(parser.parse_args().output)
@@ -0,0 +1,107 @@
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions API.
+#
+# Serves POST /v1/chat/completions, streaming (SSE) or not, with a configurable time to
+# first token and token rate, so the server can be load-tested with no network. Point
+# the OpenAI client at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    ttft = 0.3  # seconds before the first token
+    tokens_per_second = 60.0
+    completion_tokens = 120
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "gpt-4o-mini")
+        if request.get("stream"):
+            self._stream(model)
+        else:
+            time.sleep(self.ttft + self.completion_tokens / self.tokens_per_second)
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "Fake summary"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": self.completion_tokens, "total_tokens": self.completion_tokens},
+            })
+
+    def _stream(self, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send(delta, finish_reason=None):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            time.sleep(self.ttft)
+            send({"role": "assistant", "content": ""})
+            interval = 1.0 / self.tokens_per_second
+            for i in range(self.completion_tokens):
+                send({"content": f"tok{i} "})
+                time.sleep(interval)
+            send({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_fake_openai(port=0, ttft=0.3, tokens_per_second=60.0, completion_tokens=120):
+    """Start the fake server in a daemon thread; returns (server, base_url)."""
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {
+        "ttft": ttft,
+        "tokens_per_second": tokens_per_second,
+        "completion_tokens": completion_tokens,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake streaming OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=60.0)
+    parser.add_argument("--tokens", type=int, default=120)
+    args = parser.parse_args()
+    server, base_url = start_fake_openai(args.port, args.ttft, args.token_rate, args.tokens)
+    print(f"Fake OpenAI listening at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+sys.path.append('./')
+from benchmarks.fake_openai import start_fake_openai
+from benchmarks.build_snapshot import build_snapshot, DEFAULT_SNAPSHOT_DIR
+from benchmarks.prefetch import cache_env
+
+# Offline load test for the backend.
+#
+# Starts the fake OpenAI server, builds a local index snapshot if needed, launches the
+# backend (Flask or ASGI) against both, then drives /query, /summarize-convo and
+# /blackboard at the requested concurrency and reports p50/p95/p99 latency, time to
+# first byte and throughput per route. Models are read from benchmarks/cache; with
+# --offline (after benchmarks/prefetch.py) nothing talks to the network.
+#
+# Usage: python benchmarks/load_test.py --mode flask --concurrency 16 --requests 200
+#        python benchmarks/load_test.py --url http://localhost:8080   (already running server)
+
+QUERIES_FILE = os.path.join("benchmarks", "queries.txt")
+ROUTES = ["query", "summarize-convo", "blackboard"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def launch_server(mode, port, openai_base_url, snapshot_dir, extra_env):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": openai_base_url,
+        "VECTOR_STORE": "local",
+        "LOCAL_INDEX_DIR": snapshot_dir,
+        "DEBUG_FLASK": "",
+        "PORT": str(port),
+        "WARMUP_MODE": "background",
+    })
+    env.update(extra_env)
+    if mode == "flask":
+        command = [sys.executable, "server.py"]
+    elif mode == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi_server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+    return subprocess.Popen(command, env=env)
+
+
+def wait_until_ready(url, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server at {url} was not ready after {timeout}s")
+
+
+def make_request(url, route, query):
+    if route == "query":
+        payload = {"query": query, "priorConversation": []}
+    elif route == "summarize-convo":
+        payload = {"message": query}
+    else:
+        payload = {}
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    try:
+        with requests.post(f"{url}/{route}", json=payload, stream=True, timeout=120) as response:
+            for chunk in response.iter_content(chunk_size=None):
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                size += len(chunk)
+            ok = response.status_code == 200
+    except requests.RequestException:
+        ok = False
+    total = time.perf_counter() - start
+    return {"route": route, "ok": ok, "latency": total, "ttfb": first_byte if first_byte is not None else total, "bytes": size}
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(results, elapsed):
+    report = {}
+    for route in sorted({r["route"] for r in results}):
+        route_results = [r for r in results if r["route"] == route]
+        ok = [r for r in route_results if r["ok"]]
+        latencies = [r["latency"] for r in ok]
+        ttfbs = [r["ttfb"] for r in ok]
+        report[route] = {
+            "requests": len(route_results),
+            "errors": len(route_results) - len(ok),
+            "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "ttfb_p50": percentile(ttfbs, 50),
+            "ttfb_p95": percentile(ttfbs, 95),
+            "ttfb_p99": percentile(ttfbs, 99),
+        }
+    return report
+
+
+def print_report(report, elapsed):
+    print(f"\nCompleted in {elapsed:.1f}s")
+    header = f"{'route':<18}{'reqs':>6}{'errs':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'ttfb50':>9}{'ttfb95':>9}{'ttfb99':>9}"
+    print(header)
+    print("-" * len(header))
+    for route, r in report.items():
+        print(f"{route:<18}{r['requests']:>6}{r['errors']:>6}{r['throughput_rps']:>8.1f}"
+              f"{r['latency_p50']:>9.3f}{r['latency_p95']:>9.3f}{r['latency_p99']:>9.3f}"
+              f"{r['ttfb_p50']:>9.3f}{r['ttfb_p95']:>9.3f}{r['ttfb_p99']:>9.3f}")
+
+
+def run_load(url, routes, concurrency, total_requests, queries, seed=0):
+    rng = random.Random(seed)
+    jobs = [(rng.choice(routes), rng.choice(queries)) for _ in range(total_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda job: make_request(url, *job), jobs))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the DragonGPT backend")
+    parser.add_argument("--mode", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--url", help="Benchmark an already running server instead of launching one")
+    parser.add_argument("--routes", default="query", help=f"Comma-separated subset of {','.join(ROUTES)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Fake OpenAI time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=60.0, help="Fake OpenAI tokens per second")
+    parser.add_argument("--tokens", type=int, default=120, help="Fake OpenAI completion length")
+    parser.add_argument("--snapshot", default=DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache on")
+    parser.add_argument("--offline", action="store_true", help="Fail instead of downloading models (run benchmarks/prefetch.py first)")
+    parser.add_argument("--json", help="Write the report as JSON to this path")
+    parser.add_argument("--max-p95", type=float, help="Exit non-zero if any route's p95 latency exceeds this (s)")
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(",") if route.strip()]
+    with open(QUERIES_FILE, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    server_process = None
+    url = args.url
+    if url is None:
+        # Inherited by the launched server as well
+        os.environ.update(cache_env(offline=args.offline))
+        fake_openai, openai_base_url = start_fake_openai(0, args.ttft, args.token_rate, args.tokens)
+        if not os.path.exists(args.snapshot):
+            build_snapshot(args.snapshot)
+        port = free_port()
+        extra_env = {} if args.answer_cache else {"ANSWER_CACHE_ENABLED": "false"}
+        server_process = launch_server(args.mode, port, openai_base_url, args.snapshot, extra_env)
+        url = f"http://127.0.0.1:{port}"
+
+    try:
+        wait_until_ready(url)
+        results, elapsed = run_load(url, routes, args.concurrency, args.requests, queries)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait(timeout=30)
+
+    report = summarize(results, elapsed)
+    print_report(report, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"mode": args.mode, "concurrency": args.concurrency, "elapsed": elapsed, "routes": report}, f, indent=2)
+
+    failed = any(r["errors"] for r in report.values())
+    if args.max_p95 is not None:
+        failed = failed or any(r["latency_p95"] > args.max_p95 for r in report.values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
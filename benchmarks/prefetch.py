@@ -0,0 +1,38 @@
+import os
+import sys
+
+# Downloads the models the benchmark needs (the sentence-transformers embedding model and
+# the tiktoken encoding) into benchmarks/cache, so load_test.py --offline can run with no
+# network access afterwards. This is the only step that needs the network.
+#
+# Usage: python benchmarks/prefetch.py
+
+BENCH_CACHE_DIR = os.path.join("benchmarks", "cache")
+
+
+def cache_env(offline=False):
+    """Environment pointing Hugging Face and tiktoken at the benchmark cache (and forbidding downloads if offline)."""
+    env = {
+        "HF_HOME": os.path.abspath(os.path.join(BENCH_CACHE_DIR, "huggingface")),
+        "TIKTOKEN_CACHE_DIR": os.path.abspath(os.path.join(BENCH_CACHE_DIR, "tiktoken")),
+    }
+    if offline:
+        env.update({"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1"})
+    return env
+
+
+def prefetch():
+    # Both libraries read their cache locations at import time
+    os.environ.update(cache_env())
+    sys.path.append('./')
+    from sentence_transformers import SentenceTransformer
+    from data_collection.tools import data_manager
+    from data_collection.tools import token_counter
+
+    SentenceTransformer(data_manager.embedding_model_name)
+    token_counter.get_encoding()
+    print(f"Benchmark models cached in {BENCH_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    prefetch()
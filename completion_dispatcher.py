@@ -0,0 +1,242 @@
+import os
+import math
+import time
+import queue
+import asyncio
+import threading
+import metrics
+
+# Hedged and fallback streaming completions for /query.
+#
+# The primary request is sent as usual. If no token has arrived after LLM_HEDGE_DELAY
+# seconds, an identical hedge request is started and the answer streams from whichever
+# produces a token first; the other one is closed. Hedges are skipped while the server is
+# close to its admission limit (can_hedge), so they don't add upstream load when it is
+# already high. When a fallback model/endpoint is set (LLM_FALLBACK_MODEL,
+# LLM_FALLBACK_BASE_URL) and every attempt fails, or none produces a token within
+# LLM_FIRST_TOKEN_TIMEOUT, the request is sent once more to the fallback. Without a
+# fallback there is no first-token timeout: a slow answer is still better than none.
+# Errors after the first token are raised as before: part of the answer is already sent.
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 1.5))
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", 10))
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL")
+LLM_FALLBACK_BASE_URL = os.getenv("LLM_FALLBACK_BASE_URL")
+LLM_FALLBACK_API_KEY = os.getenv("LLM_FALLBACK_API_KEY")
+# No hedging once this fraction of the admission slots is in use
+LLM_HEDGE_MAX_LOAD = float(os.getenv("LLM_HEDGE_MAX_LOAD", 0.75))
+
+
+def _contents(stream):
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _acontents(stream):
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _record_winner(kind, start):
+    metrics.llm_wins_total.inc(kind=kind)
+    metrics.llm_first_token_seconds.observe(time.perf_counter() - start, kind=kind)
+
+
+class _Attempt:
+    """One streaming request, run in a thread until its first token (or error) is available."""
+
+    def __init__(self, client, model, kind, messages, results):
+        self.client = client
+        self.model = model
+        self.kind = kind
+        self.messages = messages
+        self.results = results
+        self.start = time.perf_counter()
+        self.stream = None
+        self.contents = None
+        self.first = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+        metrics.llm_attempts_total.inc(kind=kind)
+        threading.Thread(target=self._run, name=f"llm-{kind}", daemon=True).start()
+
+    def _run(self):
+        try:
+            stream = self.client.chat.completions.create(model=self.model, messages=self.messages, stream=True)
+            with self._lock:
+                self.stream = stream
+                if self.cancelled:
+                    stream.close()
+                    return
+            self.contents = _contents(stream)
+            self.first = next(self.contents, None)
+            if not self.cancelled:
+                self.results.put((self, None))
+        except Exception as e:
+            if not self.cancelled:
+                metrics.llm_attempt_errors_total.inc(kind=self.kind)
+                self.results.put((self, e))
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self.stream is not None:
+                try:
+                    self.stream.close()
+                except Exception:
+                    pass
+
+
+class CompletionDispatcher:
+    def __init__(self, client, fallback_client=None, model=LLM_MODEL, fallback_model=LLM_FALLBACK_MODEL,
+                 hedge_delay=LLM_HEDGE_DELAY if LLM_HEDGE_ENABLED else None, first_token_timeout=LLM_FIRST_TOKEN_TIMEOUT,
+                 can_hedge=None):
+        self.client = client
+        self.fallback_client = fallback_client or client
+        self.model = model
+        self.fallback_model = fallback_model or model
+        self.use_fallback = fallback_client is not None or bool(fallback_model)
+        self.hedge_delay = hedge_delay
+        self.first_token_timeout = first_token_timeout if self.use_fallback else None
+        self.can_hedge = can_hedge  # () -> bool, checked when a hedge is due
+
+    def _first_token_deadline(self, start):
+        return math.inf if self.first_token_timeout is None else start + self.first_token_timeout
+
+    def _hedge_allowed(self):
+        if self.can_hedge is not None and not self.can_hedge():
+            metrics.llm_hedges_skipped_total.inc()
+            return False
+        metrics.llm_hedges_total.inc()
+        return True
+
+    def stream(self, messages):
+        """Yield the completion's content pieces for messages, hedging and falling back as configured."""
+        results = queue.Queue()
+        start = time.monotonic()
+        attempts = [_Attempt(self.client, self.model, "primary", messages, results)]
+        hedged = self.hedge_delay is None
+        fallen_back = False
+        last_error = None
+        while True:
+            now = time.monotonic()
+            first_token_deadline = self._first_token_deadline(start)
+            wait_until = first_token_deadline if hedged else min(start + self.hedge_delay, first_token_deadline)
+            try:
+                attempt, error = results.get(timeout=None if wait_until == math.inf else max(0.0, wait_until - now))
+            except queue.Empty:
+                if not hedged and now < first_token_deadline:
+                    hedged = True
+                    if self._hedge_allowed():
+                        attempts.append(_Attempt(self.client, self.model, "hedge", messages, results))
+                    continue
+                attempt, error = None, TimeoutError(f"No token within {self.first_token_timeout}s")
+                metrics.llm_attempt_errors_total.inc(kind="timeout")
+                for pending in attempts:
+                    pending.cancel()
+                attempts = []
+
+            if attempt is not None and attempt not in attempts:
+                continue  # a cancelled attempt finishing late
+            if error is None:
+                for other in attempts:
+                    if other is not attempt:
+                        other.cancel()
+                _record_winner(attempt.kind, attempt.start)
+                if attempt.first is not None:
+                    yield attempt.first
+                    yield from attempt.contents
+                return
+
+            last_error = error
+            if attempt is not None:
+                attempts.remove(attempt)
+            if attempts:
+                continue  # another attempt may still succeed
+            if fallen_back or not self.use_fallback:
+                raise last_error
+            print(f"Completion failed ({last_error}), retrying with the fallback model")
+            fallen_back = hedged = True
+            start = time.monotonic()
+            attempts = [_Attempt(self.fallback_client, self.fallback_model, "fallback", messages, results)]
+
+
+class AsyncCompletionDispatcher(CompletionDispatcher):
+    """CompletionDispatcher for AsyncOpenAI clients (asgi_server.py)."""
+
+    async def _attempt(self, client, model, kind, messages, streams):
+        metrics.llm_attempts_total.inc(kind=kind)
+        start = time.perf_counter()
+        try:
+            stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+            streams.append(stream)
+            contents = _acontents(stream)
+            return kind, start, stream, contents, await anext(contents, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.llm_attempt_errors_total.inc(kind=kind)
+            raise
+
+    async def stream(self, messages):
+        streams = []
+        tasks = {asyncio.create_task(self._attempt(self.client, self.model, "primary", messages, streams))}
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        hedged = self.hedge_delay is None
+        fallen_back = False
+        winner = None
+        last_error = None
+        try:
+            while winner is None:
+                first_token_deadline = self._first_token_deadline(start)
+                wait_until = first_token_deadline if hedged else min(start + self.hedge_delay, first_token_deadline)
+                timeout = None if wait_until == math.inf else max(0.0, wait_until - loop.time())
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task.result()
+                        break
+                    last_error = task.exception()
+                if winner is not None:
+                    break
+                if not done:
+                    if not hedged and loop.time() < first_token_deadline:
+                        hedged = True
+                        if self._hedge_allowed():
+                            tasks.add(asyncio.create_task(self._attempt(self.client, self.model, "hedge", messages, streams)))
+                        continue
+                    last_error = TimeoutError(f"No token within {self.first_token_timeout}s")
+                    metrics.llm_attempt_errors_total.inc(kind="timeout")
+                    for task in tasks:
+                        task.cancel()
+                    tasks = set()
+                if tasks:
+                    continue
+                if fallen_back or not self.use_fallback:
+                    raise last_error
+                print(f"Completion failed ({last_error}), retrying with the fallback model")
+                fallen_back = hedged = True
+                start = loop.time()
+                tasks = {asyncio.create_task(self._attempt(self.fallback_client, self.fallback_model, "fallback", messages, streams))}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        kind, attempt_start, winning_stream, contents, first = winner
+        _record_winner(kind, attempt_start)
+        # Close the losers' connections (a loser may also have produced a token, just later)
+        for stream in streams:
+            if stream is not winning_stream:
+                try:
+                    await stream.close()
+                except Exception:
+                    pass
+        if first is not None:
+            yield first
+            async for content in contents:
+                yield content
@@ -0,0 +1,139 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from data_collection.tools.token_counter import count_tokens, truncate_to_tokens
+
+# Bounded conversation history for the /query prompt.
+#
+# The last HISTORY_VERBATIM_TURNS turns of priorConversation are kept word for word and
+# everything older is replaced by a rolling summary. Summaries are cached under a hash of
+# the conversation prefix they cover, so each new turn only extends the longest cached
+# summary with the turns that were added since, in a background thread. Until that
+# extension is ready the uncovered turns are sent verbatim. The rendered section never
+# exceeds HISTORY_TOKEN_BUDGET tokens. At most HISTORY_SUMMARY_MAX_PENDING extensions wait
+# to run; a newer extension of the same cached summary replaces the queued one (it covers
+# more turns), and extensions beyond the limit are dropped and retried on a later turn.
+
+HISTORY_VERBATIM_TURNS = int(os.getenv("HISTORY_VERBATIM_TURNS", 6))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1500))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", 300))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", 2048))
+HISTORY_SUMMARY_MAX_PENDING = int(os.getenv("HISTORY_SUMMARY_MAX_PENDING", 32))
+HISTORY_SUMMARY_WORKERS = 2
+
+
+def format_turn(entry):
+    speaker = "User" if entry['isUser'] else "Bot"
+    return f"{speaker}: {entry['text']}\n"
+
+
+def prefix_hashes(turns):
+    """hashes[i] identifies the conversation prefix turns[:i] (hashes[0] is the empty prefix)."""
+    hashes = [""]
+    for turn in turns:
+        hashes.append(hashlib.sha1((hashes[-1] + "\x1e" + turn).encode("utf-8")).hexdigest())
+    return hashes
+
+
+class ConversationHistory:
+    def __init__(self, summarizer=None, verbatim_turns=HISTORY_VERBATIM_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                 summary_max_tokens=HISTORY_SUMMARY_MAX_TOKENS, cache_size=HISTORY_SUMMARY_CACHE_SIZE,
+                 max_pending=HISTORY_SUMMARY_MAX_PENDING):
+        # summarizer(previous_summary, new_turns_text) -> extended summary text
+        self.summarizer = summarizer
+        self.verbatim_turns = verbatim_turns
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._summaries = OrderedDict()  # prefix hash -> summary
+        self._queued = OrderedDict()  # conversation -> (key, previous_summary, new_turns)
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix="history-summary")
+
+    def _cached_summary(self, hashes, end):
+        """Longest cached summary covering turns[:i] for i <= end; returns (i, summary)."""
+        with self._lock:
+            for i in range(end, 0, -1):
+                summary = self._summaries.get(hashes[i])
+                if summary is not None:
+                    self._summaries.move_to_end(hashes[i])
+                    return i, summary
+        return 0, ""
+
+    def _run_next(self):
+        with self._lock:
+            if not self._queued:
+                return
+            _, (key, previous_summary, new_turns) = self._queued.popitem(last=False)
+            if key in self._summaries:
+                return
+            self._running.add(key)
+        self._extend(key, previous_summary, new_turns)
+
+    def _extend(self, key, previous_summary, new_turns):
+        try:
+            summary = self.summarizer(previous_summary, "".join(new_turns))
+            summary = truncate_to_tokens(summary.strip(), self.summary_max_tokens)
+            with self._lock:
+                self._summaries[key] = summary
+                while len(self._summaries) > self.cache_size:
+                    self._summaries.popitem(last=False)
+        except Exception as e:
+            print(f"Error summarizing conversation history: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(key)
+
+    def _schedule(self, conversation, key, previous_summary, new_turns):
+        """Queue a summary covering the prefix key, replacing a queued job for the same conversation."""
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if key in self._running or key in self._summaries:
+                return
+            if conversation in self._queued:
+                self._queued[conversation] = (key, previous_summary, new_turns)
+                return
+            if len(self._queued) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._queued[conversation] = (key, previous_summary, new_turns)
+        self._executor.submit(self._run_next)
+
+    def render(self, chat_data):
+        """The history section of the prompt for priorConversation, within the token budget."""
+        if not chat_data:
+            return ""
+        turns = [format_turn(entry) for entry in chat_data]
+        older = max(0, len(turns) - self.verbatim_turns)
+        summary = ""
+        covered = 0
+        if older:
+            hashes = prefix_hashes(turns[:older])
+            covered, summary = self._cached_summary(hashes, older)
+            if covered < older:
+                # Jobs are merged per conversation: same cached summary and same first uncovered turn
+                self._schedule(hashes[covered + 1], hashes[older], summary, turns[covered:older])
+
+        header = f"Summary of the earlier conversation: {summary}\n" if summary else ""
+        remaining = self.token_budget - count_tokens(header)
+        kept = []
+        # Newest turns first; whatever does not fit in the budget is dropped from the oldest end
+        for turn in reversed(turns[covered:]):
+            tokens = count_tokens(turn)
+            if tokens > remaining:
+                if not kept and remaining > 0:
+                    kept.append(truncate_to_tokens(turn, remaining))
+                break
+            kept.append(turn)
+            remaining -= tokens
+        return header + "".join(reversed(kept))
+
+    def stats(self):
+        with self._lock:
+            return {"summaries": len(self._summaries), "pending": len(self._queued) + len(self._running), "dropped": self.dropped}
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import numpy as np
+from data_collection.tools.context_assembler import detect_source_type
+
+# Local BM25 inverted index over the same chunks the upload_*_to_index functions write.
+#
+# Dense MiniLM similarity is weak on exact tokens such as course identifiers ("CS 171"),
+# CRNs and organization names; BM25 catches those, and retrieve() fuses both rankings
+# with reciprocal rank fusion. Postings are stored as flat arrays (CSR layout: offsets
+# into doc_ids / term_freqs) in .npy files that are memory-mapped on load.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens, plus joined subject+number tokens ("cs 171" -> "cs171")."""
+    tokens = re.findall(r"[a-z]+|\d+", text.lower())
+    joined = [a + b for a, b in zip(tokens, tokens[1:]) if a.isalpha() and b.isdigit()]
+    return tokens + joined
+
+
+def document_text(metadata):
+    """Title fields plus chunk text for a chunk's metadata."""
+    source_type = detect_source_type(metadata)
+    if source_type is None:
+        return " ".join(str(value) for value in metadata.values())
+    title = " ".join(str(metadata.get(field, "")) for field in source_type["title"])
+    return f"{title} {metadata.get(source_type['text'], '')}"
+
+
+def chunk_key(vector_id, metadata):
+    """Chunk ids are only unique within their source's namespace, so chunks are identified by (source, id)."""
+    source_type = detect_source_type(metadata or {})
+    return (source_type["source"] if source_type is not None else "", vector_id)
+
+
+class BM25Index:
+    def __init__(self, path):
+        self.path = path
+        self.ids = []
+        self.texts = []
+        self.metadata = []
+        self.vocabulary = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.zeros(0, dtype=np.float32)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self._sources = None
+        if os.path.exists(os.path.join(path, "offsets.npy")):
+            self.load()
+
+    def load(self):
+        for name in ["offsets", "doc_ids", "term_freqs", "doc_lengths", "idf"]:
+            setattr(self, name, np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(self.path, "vocabulary.json"), "r", encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        with open(os.path.join(self.path, "documents.json"), "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        self.ids, self.texts, self.metadata = documents["ids"], documents["texts"], documents["metadata"]
+
+    def add(self, vectors):
+        """Add or replace chunks given in the upsert format ({'id', 'metadata', ...})."""
+        positions = {chunk_key(vector_id, metadata): i for i, (vector_id, metadata) in enumerate(zip(self.ids, self.metadata))}
+        for item in vectors:
+            text = document_text(item.get('metadata', {}))
+            key = chunk_key(item['id'], item.get('metadata', {}))
+            position = positions.get(key)
+            if position is None:
+                positions[key] = len(self.ids)
+                self.ids.append(item['id'])
+                self.texts.append(text)
+                self.metadata.append(item.get('metadata', {}))
+            else:
+                self.texts[position] = text
+                self.metadata[position] = item.get('metadata', {})
+
+    def build(self):
+        """Rebuild the postings arrays from self.texts."""
+        postings = {}
+        doc_lengths = np.zeros(len(self.texts), dtype=np.float32)
+        for doc_id, text in enumerate(self.texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+
+        vocabulary = {}
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        doc_ids, term_freqs = [], []
+        for term_id, (term, term_postings) in enumerate(sorted(postings.items())):
+            vocabulary[term] = term_id
+            offsets[term_id + 1] = offsets[term_id] + len(term_postings)
+            for doc_id, count in term_postings:
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+
+        n_docs = len(self.texts)
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = np.array(doc_ids, dtype=np.int32)
+        self.term_freqs = np.array(term_freqs, dtype=np.float32)
+        self.doc_lengths = doc_lengths
+        self.idf = np.log(1 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        for name in ["offsets", "doc_ids", "term_freqs", "doc_lengths", "idf"]:
+            np.save(os.path.join(self.path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(self.path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f)
+        with open(os.path.join(self.path, "documents.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "texts": self.texts, "metadata": self.metadata}, f)
+        self.load()
+
+    def chunk_sources(self):
+        """Array of each chunk's source name (see context_assembler.SOURCE_TYPES), computed once."""
+        if self._sources is None or len(self._sources) != len(self.ids):
+            self._sources = np.array([(detect_source_type(metadata) or {}).get("source", "") for metadata in self.metadata])
+        return self._sources
+
+    def search(self, query, top_k=10, sources=None):
+        """Returns matches shaped like vector matches: {'id', 'score', 'metadata'}, optionally only from the given sources."""
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        average_length = float(np.mean(self.doc_lengths)) or 1.0
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / average_length)
+            scores[docs] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm)
+        if sources is not None:
+            scores[~np.isin(self.chunk_sources(), list(sources))] = 0
+
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        if top_k == 0:
+            return []
+        positions = np.argpartition(-scores, top_k - 1)[:top_k]
+        positions = positions[np.argsort(-scores[positions])]
+        return [{"id": self.ids[p], "score": float(scores[p]), "metadata": self.metadata[p]} for p in positions]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Fuse ranked match lists by sum of 1/(k + rank). The returned matches keep the first
+    ranking's (dense) score as "score" (0.0 if it only came from a later ranking) and
+    carry the fused score as "rrf_score". Matches are the same chunk when their chunk_key()s match.
+    """
+    fused = {}
+    for ranking_number, ranking in enumerate(rankings):
+        for rank, match in enumerate(ranking):
+            key = chunk_key(match["id"], match["metadata"])
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {
+                    "id": match["id"],
+                    "score": float(match["score"]) if ranking_number == 0 else 0.0,
+                    "metadata": match["metadata"],
+                    "rrf_score": 0.0,
+                }
+            entry["rrf_score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda match: match["rrf_score"], reverse=True)[:top_k]
@@ -0,0 +1,53 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+from data_collection.tools import embedding_service
+
+# Batched document embedding for the upload_*_to_index ingestion functions.
+#
+# Chunks are collected first and encoded INGEST_EMBED_BATCH_SIZE at a time instead of one
+# forward pass per chunk. With INGEST_EMBED_WORKERS > 1 (0 = one per CPU core) the batches
+# are spread over that many worker processes, each loading its own copy of the embedding
+# model and using an even share of the cores for torch. Vectors come back in input order
+# and progress is reported per batch. Workers are spawned, so scripts that call the upload
+# functions need an `if __name__ == "__main__":` guard.
+
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 256))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 1))
+# Texts per forward pass inside a batch; the model sorts a batch by length, so this keeps padding low
+ENCODE_BATCH_SIZE = 32
+
+
+def _init_worker(torch_threads):
+    from data_collection.tools import data_manager
+    data_manager.get_embedding_model()
+    if data_manager.embedding_backend != "onnx":
+        embedding_service.configure_torch_threads(torch_threads)
+
+
+def _encode_batch(texts):
+    from data_collection.tools import data_manager
+    return data_manager.get_embedding_model().encode(texts, batch_size=ENCODE_BATCH_SIZE)
+
+
+def embed_texts(texts, batch_size=INGEST_EMBED_BATCH_SIZE, workers=INGEST_EMBED_WORKERS, desc="Embedding"):
+    """Returns one vector per text, in order."""
+    workers = workers or os.cpu_count() or 1
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = []
+    with tqdm(total=len(texts), desc=desc, unit="chunk") as progress:
+        if workers <= 1 or len(batches) <= 1:
+            for batch in batches:
+                vectors.extend(_encode_batch(batch))
+                progress.update(len(batch))
+            return vectors
+
+        workers = min(workers, len(batches))
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(torch_threads,)) as pool:
+            for batch_vectors in pool.map(_encode_batch, batches):
+                vectors.extend(batch_vectors)
+                progress.update(len(batch_vectors))
+    return vectors
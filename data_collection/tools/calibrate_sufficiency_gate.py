@@ -0,0 +1,74 @@
+import sys
+import json
+import itertools
+sys.path.append('./')
+from data_collection.tools import data_manager
+from data_collection.tools import sufficiency_gate
+
+# Offline calibration of the retrieval sufficiency gate.
+#
+# Input is a JSONL file of labeled queries, one per line:
+#   {"query": "When is the add/drop deadline?", "sufficient": true}
+# where "sufficient" says whether the index alone answers the query. Every threshold
+# combination in the grid is scored by balanced accuracy and the best one is written to
+# SUFFICIENCY_THRESHOLDS_PATH, which sufficiency_gate loads at startup.
+#
+# Usage: python data_collection/tools/calibrate_sufficiency_gate.py labeled_queries.jsonl [k]
+
+GRID = {
+    "min_top_score": [0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6],
+    "strong_top_score": [0.6, 0.65, 0.7, 0.75, 0.8, 1.01],
+    "min_score_gap": [0.0, 0.02, 0.05, 0.1],
+    "min_term_coverage": [0.3, 0.4, 0.5, 0.6, 0.7, 0.8],
+}
+
+
+def load_labeled_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def balanced_accuracy(signal_rows, thresholds):
+    true_positive = true_negative = positives = negatives = 0
+    for signals, label in signal_rows:
+        predicted = sufficiency_gate.is_sufficient(signals, thresholds)
+        if label:
+            positives += 1
+            true_positive += predicted
+        else:
+            negatives += 1
+            true_negative += not predicted
+    recall_positive = true_positive / positives if positives else 1.0
+    recall_negative = true_negative / negatives if negatives else 1.0
+    return (recall_positive + recall_negative) / 2
+
+
+def calibrate(labeled_queries, k=5):
+    signal_rows = []
+    for item in labeled_queries:
+        retrieval = data_manager.retrieve(item["query"], k)
+        signals = sufficiency_gate.compute_signals(item["query"], retrieval["matches"], retrieval["context"])
+        signal_rows.append((signals, bool(item["sufficient"])))
+
+    best_thresholds, best_score = None, -1.0
+    names = list(GRID)
+    for values in itertools.product(*(GRID[name] for name in names)):
+        thresholds = dict(zip(names, values))
+        if thresholds["strong_top_score"] < thresholds["min_top_score"]:
+            continue
+        score = balanced_accuracy(signal_rows, thresholds)
+        if score > best_score:
+            best_thresholds, best_score = thresholds, score
+    return best_thresholds, best_score
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python data_collection/tools/calibrate_sufficiency_gate.py labeled_queries.jsonl [k]")
+        sys.exit(2)
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    thresholds, score = calibrate(load_labeled_queries(sys.argv[1]), k)
+    print(f"Best thresholds (balanced accuracy {score:.3f}): {thresholds}")
+    with open(sufficiency_gate.SUFFICIENCY_THRESHOLDS_PATH, "w") as f:
+        json.dump(thresholds, f, indent=2)
+    print(f"Wrote {sufficiency_gate.SUFFICIENCY_THRESHOLDS_PATH}")
@@ -0,0 +1,119 @@
+import os
+import json
+from data_collection.tools.token_counter import count_tokens
+
+# Turns vector matches into the retrieved-context section of the prompt.
+#
+# Each source type written by the upload_*_to_index functions declares which metadata
+# field identifies the document, which field holds the chunk text, which short fields are
+# worth keeping and which field is the citation. Chunks of the same document are merged,
+# and documents are packed in rank order into CONTEXT_TOKEN_BUDGET tokens.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+MIN_TRUNCATED_TOKENS = 64  # don't bother adding part of a document in less room than this
+
+# Checked in order; the first source whose "key" field is present in the metadata wins
+SOURCE_TYPES = [
+    {"source": "course", "key": "Identifier", "title": ["Identifier", "Title"], "text": "Description",
+     "fields": ["Number_of_credits", "College/Department", "Prerequisites", "Repeat Status"], "citation": "url"},
+    {"source": "tms", "key": "CRN", "title": ["SubjectCode", "CourseNo", "CourseTitle"], "text": "Text_Chunk",
+     "fields": [], "citation": "CRN_URL"},
+    {"source": "student_org", "key": "Org Name", "title": ["Org Name"], "text": "Text_Chunk",
+     "fields": [], "citation": "URL"},
+    {"source": "graduate_program", "key": "program_name", "title": ["program_name"], "text": "Text_Chunk",
+     "fields": [], "citation": "url"},
+    {"source": "major", "key": "major_name", "title": ["major_name"], "text": "Text_Chunk",
+     "fields": [], "citation": None},
+    {"source": "minor", "key": "minor_name", "title": ["minor_name"], "text": "Text_Chunk",
+     "fields": [], "citation": None},
+    {"source": "college", "key": "majors", "title": ["name"], "text": "Text_Chunk",
+     "fields": [], "citation": None},
+    {"source": "official_page", "key": "Header", "title": ["Header"], "text": "Text_Chunk",
+     "fields": [], "citation": "URL"},
+]
+_SOURCE_BY_NAME = {source_type["source"]: source_type for source_type in SOURCE_TYPES}
+
+
+def detect_source_type(metadata):
+    if metadata.get("source") in _SOURCE_BY_NAME:
+        return _SOURCE_BY_NAME[metadata["source"]]
+    for source_type in SOURCE_TYPES:
+        if source_type["key"] in metadata:
+            return source_type
+    return None
+
+
+def _document_key(metadata, source_type):
+    if source_type is None:
+        return ("unknown", json.dumps(metadata, sort_keys=True, default=str))
+    if source_type["source"] == "tms":
+        return ("tms", metadata.get("CRN"))
+    if source_type["source"] == "college":
+        return ("college", metadata.get("name"))
+    return (source_type["source"], metadata.get(source_type["key"]))
+
+
+def group_documents(matches):
+    """Merge matches into documents, keeping the rank of each document's best chunk."""
+    documents = {}
+    for match in matches:
+        metadata = match["metadata"] or {}
+        source_type = detect_source_type(metadata)
+        key = _document_key(metadata, source_type)
+        document = documents.get(key)
+        if document is None:
+            document = documents[key] = {"source_type": source_type, "metadata": metadata, "chunks": {}}
+        if source_type is None:
+            text = "\n".join(f"{field}: {value}" for field, value in metadata.items())
+        else:
+            text = metadata.get(source_type["text"], "")
+        chunk_index = metadata.get("Chunk_Index", len(document["chunks"]))
+        if text and text not in document["chunks"].values():
+            document["chunks"].setdefault(chunk_index, text)
+    return list(documents.values())
+
+
+def format_document(document, max_chunks=None):
+    """Returns (text, citation); with max_chunks only the document's first max_chunks chunks are included."""
+    source_type, metadata = document["source_type"], document["metadata"]
+    chunk_indexes = sorted(document["chunks"], key=float)[:max_chunks]
+    text = "\n".join(document["chunks"][i] for i in chunk_indexes)
+    if source_type is None:
+        return text, None
+    title = " ".join(str(metadata[field]) for field in source_type["title"] if metadata.get(field))
+    lines = [f"## {title}"] if title else []
+    lines += [f"{field}: {metadata[field]}" for field in source_type["fields"] if metadata.get(field)]
+    lines.append(text)
+    citation = metadata.get(source_type["citation"]) if source_type["citation"] else None
+    return "\n".join(lines), citation
+
+
+def _block(document, max_chunks=None):
+    body, citation = format_document(document, max_chunks)
+    return body + (f"\nSource: {citation}" if citation else "")
+
+
+def assemble_context(matches, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Returns the context text for the prompt, at most token_budget tokens. Documents are
+    added whole in rank order; one that doesn't fit contributes the leading whole chunks
+    that do (or nothing), and lower-ranked documents still get the remaining room.
+    """
+    blocks = []
+    remaining = token_budget
+    for document in group_documents(matches):
+        block = _block(document)
+        tokens = count_tokens(block) + 2  # separator
+        if tokens <= remaining:
+            blocks.append(block)
+            remaining -= tokens
+            continue
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            for max_chunks in range(len(document["chunks"]) - 1, 0, -1):
+                block = _block(document, max_chunks)
+                tokens = count_tokens(block) + 2
+                if tokens <= remaining:
+                    blocks.append(block)
+                    remaining -= tokens
+                    break
+    return "\n\n".join(blocks)
@@ -1,6 +1,3 @@
-from pinecone import Pinecone
-from pinecone import ServerlessSpec
-from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import os
 import time
@@ -9,23 +6,104 @@ import csv
 from dotenv import load_dotenv
 from itertools import islice
 import unicodedata
-import requests
-from duckduckgo_search import DDGS
-from bs4 import BeautifulSoup
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from data_collection.tools import vector_store
+from data_collection.tools.embedding_cache import query_embedding_cache
+from data_collection.tools import embedding_service
+from data_collection.tools import bulk_embedder
+from data_collection.tools.context_assembler import assemble_context, CONTEXT_TOKEN_BUDGET
+from data_collection.tools import web_fetcher
+from data_collection.tools import bm25_index
+from data_collection.tools import reranker
+from data_collection.tools import query_router
+from data_collection.tools import tms_db
 
 # Load environment variables
 load_dotenv("keys.env") #not needed for deployment
 
 # Globals
-pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-spec = ServerlessSpec(cloud="aws", region="us-east-1")
 index_name = "dragongpt" #"tms"
-index = pc.Index(index_name)
-
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+embedding_model_name = 'all-MiniLM-L6-v2'
+embedding_backend = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch" or "onnx" (see onnx_encoder.py)
+
+# The index client and embedding model are created on first use (or by lifecycle.warm_up)
+# so importing this module stays cheap
+_index = None
+_lexical_index = None
+_embedding_model = None
+_init_lock = threading.Lock()
+
+# Namespaces routed to by query_router are searched concurrently
+_namespace_pool = ThreadPoolExecutor(max_workers=len(query_router.NAMESPACES), thread_name_prefix="namespace-query")
+
+# Fuse BM25 results with dense results when a lexical index has been built
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+
+def get_index():
+    global _index
+    if _index is None:
+        with _init_lock:
+            if _index is None:
+                _index = vector_store.open_index(index_name)  # Pinecone or local snapshot, see VECTOR_STORE
+    return _index
+
+def reset_after_fork():
+    """
+    Called in each worker forked from a preloaded master (gunicorn.conf.py). Pinecone
+    connections can't be shared across processes, so the client is reopened lazily; the
+    embedding model and a local (memory-mapped) index stay shared copy-on-write.
+    """
+    global _index
+    if _index is not None and not isinstance(_index, vector_store.LocalIndex):
+        _index = None
+
+def lexical_index_path(name):
+    return os.path.join(vector_store.LOCAL_INDEX_DIR, f"{name}_bm25")
+
+def get_lexical_index():
+    """The BM25 index for index_name, or None if ingestion hasn't built one."""
+    global _lexical_index
+    if _lexical_index is None:
+        with _init_lock:
+            if _lexical_index is None:
+                _lexical_index = bm25_index.BM25Index(lexical_index_path(index_name))
+    return _lexical_index if _lexical_index.ids else None
+
+# Function to add ingested chunks to the local BM25 index for the named index
+def update_lexical_index(name, pinecone_data):
+    global _lexical_index
+    lexical_index = bm25_index.BM25Index(lexical_index_path(name))
+    lexical_index.add(pinecone_data)
+    lexical_index.build()
+    lexical_index.save()
+    if name == index_name:
+        _lexical_index = lexical_index
+    print(f"BM25 index '{name}' now has {len(lexical_index.ids)} chunks")
+
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        with _init_lock:
+            if _embedding_model is None and embedding_backend == "onnx":
+                from data_collection.tools.onnx_encoder import OnnxEncoder
+                _embedding_model = OnnxEncoder()
+            elif _embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                embedding_service.configure_torch_threads()
+                _embedding_model = SentenceTransformer(embedding_model_name)
+    return _embedding_model
+
+# Concurrent query embeddings are coalesced into batched forward passes
+embedding_batcher = embedding_service.EmbeddingBatcher(
+    lambda texts: get_embedding_model().encode(texts, batch_size=len(texts))
+)
 
 # Function to create an index in Pinecone
 def make_index(index_name):
+    from pinecone import ServerlessSpec
+    pc = vector_store.pinecone_client()
+    spec = ServerlessSpec(cloud="aws", region="us-east-1")
     if index_name in pc.list_indexes().names():
         pc.delete_index(index_name)
 
@@ -42,7 +120,14 @@ def make_index(index_name):
 
 # Function to create a vector from JSON data
 def create_vector(json_data):
-    return embedding_model.encode(json.dumps(json_data))
+    return get_embedding_model().encode(json.dumps(json_data))
+
+# Function to embed each item's metadata[text_field] (as create_vector would) into its 'values',
+# in batches across INGEST_EMBED_WORKERS processes (bulk_embedder.py)
+def add_vectors(pinecone_data, text_field):
+    texts = [json.dumps(item['metadata'][text_field]) for item in pinecone_data]
+    for item, vector in zip(pinecone_data, bulk_embedder.embed_texts(texts)):
+        item['values'] = vector
 
 # Function to chunk text if it exceeds a specified length
 def chunk_text_if_needed(text, max_tokens_per_chunk=256):
@@ -87,8 +172,8 @@ def upload_course_desc_files_to_index(filepath, batch_size=200, max_tokens_per_c
         description_chunks = chunk_text_if_needed(data_item['Description'], max_tokens_per_chunk)
 
         for chunk_index, description_chunk in enumerate(description_chunks):
-            vector = create_vector(description_chunk)
             metadata = {
+                'source': 'course',
                 'Identifier': data_item['Identifier'],
                 'Title': data_item['Title'],
                 'Number_of_credits': data_item['Number_of_credits'],
@@ -100,16 +185,18 @@ def upload_course_desc_files_to_index(filepath, batch_size=200, max_tokens_per_c
             }
             pinecone_data.append({
                 'id': f"{data_item['Identifier']}_chunk_{chunk_index}",  # Unique ID for each chunk
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Description')
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='course')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added data to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 # Function to upload official Drexel data to the Pinecone index
 def upload_official_drexel_data_to_index(filepath, batch_size=200, max_tokens_per_chunk=256):
@@ -126,8 +213,8 @@ def upload_official_drexel_data_to_index(filepath, batch_size=200, max_tokens_pe
         text_chunks = chunk_text_if_needed(text, max_tokens_per_chunk)
 
         for chunk_index, text_chunk in enumerate(text_chunks):
-            vector = create_vector(text_chunk)
             metadata = {
+                'source': 'official_page',
                 'Header': header,
                 'URL': url,
                 'Text_Chunk': text_chunk,
@@ -135,16 +222,18 @@ def upload_official_drexel_data_to_index(filepath, batch_size=200, max_tokens_pe
             }
             pinecone_data.append({
                 'id': f"{url}_chunk_{chunk_index}",  # Unique ID for each chunk
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Text_Chunk')
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='official_page')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added data to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 # Function to upload student organization data to the Pinecone index
 def upload_student_orgs_to_index(textfile, urlsfile, batch_size=200, max_tokens_per_chunk=256):
@@ -167,8 +256,8 @@ def upload_student_orgs_to_index(textfile, urlsfile, batch_size=200, max_tokens_
         text_chunks = chunk_text_if_needed(combined_text, max_tokens_per_chunk)
 
         for chunk_index, text_chunk in enumerate(text_chunks):
-            vector = create_vector(text_chunk)
             metadata = {
+                'source': 'student_org',
                 'Org Name': org_name,
                 'Description': description,
                 'URL': url,
@@ -178,17 +267,19 @@ def upload_student_orgs_to_index(textfile, urlsfile, batch_size=200, max_tokens_
 
             pinecone_data.append({
                 'id': f"{org_name}_chunk_{chunk_index}",  # Unique ID for each chunk
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Text_Chunk')
     # Batch upload to Pinecone
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='student_org')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added student organizations data to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 
 def upload_college_info_to_index(filepath, batch_size=200, max_tokens_per_chunk=256):
@@ -212,8 +303,8 @@ def upload_college_info_to_index(filepath, batch_size=200, max_tokens_per_chunk=
         text_chunks = chunk_text_if_needed(normalize_text(combined_text), max_tokens_per_chunk)
 
         for chunk_index, text_chunk in enumerate(text_chunks):
-            vector = create_vector(text_chunk)
             metadata = {
+                'source': 'college',
                 'name': college_name,
                 'description': description,
                 'majors': majors,
@@ -227,17 +318,19 @@ def upload_college_info_to_index(filepath, batch_size=200, max_tokens_per_chunk=
 
             pinecone_data.append({
                 'id': f"{college_name}_chunk_{chunk_index}",  # Unique ID for each chunk
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Text_Chunk')
     # Batch upload to Pinecone
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='college')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added college info to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 
 def upload_graduate_programs_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
@@ -268,8 +361,8 @@ def upload_graduate_programs_to_index(filepath, batch_size=100, max_tokens_per_c
         text_chunks = chunk_text_if_needed(normalize_text(combined_text), max_tokens_per_chunk)
 
         for chunk_index, text_chunk in enumerate(text_chunks):
-            vector = create_vector(text_chunk)
             metadata = {
+                'source': 'graduate_program',
                 'program_name': program_name_ascii,  # Use the ASCII-safe program name
                 'program_details': program_details_str,  # Use stringified version
                 'sections': sections_str,  # Use stringified version
@@ -284,17 +377,19 @@ def upload_graduate_programs_to_index(filepath, batch_size=100, max_tokens_per_c
 
             pinecone_data.append({
                 'id': vector_id,  # Use the ASCII-safe ID
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Text_Chunk')
     # Batch upload to Pinecone with smaller batch size
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='graduate_program')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added graduate programs info to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 def upload_majors_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
     with open(filepath, "r", encoding="utf-8", errors="replace") as f:
@@ -325,8 +420,8 @@ def upload_majors_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
         text_chunks = chunk_text_if_needed(normalize_text(combined_text), max_tokens_per_chunk)
 
         for chunk_index, text_chunk in enumerate(text_chunks):
-            vector = create_vector(text_chunk)
             metadata = {
+                'source': 'major',
                 'major_name': major_name_ascii,  # Use ASCII-safe major name
                 'about_the_program': about_the_program,
                 'degree_requirements': degree_requirements_str,
@@ -342,17 +437,19 @@ def upload_majors_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
 
             pinecone_data.append({
                 'id': vector_id,  # Use ASCII-safe ID
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Text_Chunk')
     # Batch upload to Pinecone with smaller batch size
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='major')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added majors info to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 def upload_minors_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
     with open(filepath, "r", encoding="utf-8", errors="replace") as f:
@@ -379,8 +476,8 @@ def upload_minors_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
         text_chunks = chunk_text_if_needed(normalize_text(combined_text), max_tokens_per_chunk)
 
         for chunk_index, text_chunk in enumerate(text_chunks):
-            vector = create_vector(text_chunk)
             metadata = {
+                'source': 'minor',
                 'minor_name': minor_name_ascii,  # Use ASCII-safe minor name
                 'about': about,  # Ensure 'about' is not None
                 'requirements': requirements_str,
@@ -394,22 +491,24 @@ def upload_minors_to_index(filepath, batch_size=100, max_tokens_per_chunk=256):
 
             pinecone_data.append({
                 'id': vector_id,  # Use ASCII-safe ID
-                'values': vector,
                 'metadata': metadata
             })
 
+    add_vectors(pinecone_data, 'Text_Chunk')
     # Batch upload to Pinecone with smaller batch size
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='minor')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added minors info to index")
     print("Here is what the index looks like:")
-    print(index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 
 def upload_tms_data_to_index(filepath, batch_size=200, max_tokens_per_chunk=256):
     """
-    Upload Term Master Schedule (TMS) data to the Pinecone index named 'tms'.
+    Upload Term Master Schedule (TMS) data to the 'tms' namespace of the index.
 
     Parameters:
         filepath (str): Path to the CSV file containing the TMS data.
@@ -447,8 +546,8 @@ def upload_tms_data_to_index(filepath, batch_size=200, max_tokens_per_chunk=256)
             text_chunks = chunk_text_if_needed(normalize_text(combined_text), max_tokens_per_chunk)
 
             for chunk_index, text_chunk in enumerate(text_chunks):
-                vector = create_vector(text_chunk)
                 metadata = {
+                    'source': 'tms',
                     'SubjectCode': subject_code,
                     'CourseNo': course_no,
                     'InstrType': instr_type,
@@ -469,66 +568,127 @@ def upload_tms_data_to_index(filepath, batch_size=200, max_tokens_per_chunk=256)
 
                 pinecone_data.append({
                     'id': vector_id,  # Use unique ID for each chunk
-                    'values': vector,
                     'metadata': metadata
                 })
 
-    # Initialize the Pinecone index for TMS if not already existing
-    tms_index_name = "tms"
-    if tms_index_name not in pc.list_indexes():
-        make_index(tms_index_name)
-    tms_index = pc.Index(tms_index_name)
-
-    # Batch upload to Pinecone
+    add_vectors(pinecone_data, 'Text_Chunk')
+    # TMS sections go into their own namespace of the main index so /query can route to them
     for ids_vectors_chunk in chunks(pinecone_data, batch_size=batch_size):
-        tms_index.upsert(vectors=ids_vectors_chunk)
+        get_index().upsert(vectors=ids_vectors_chunk, namespace='tms')
+    get_index().flush()
+    update_lexical_index(index_name, pinecone_data)
 
     print("Added TMS data to index")
     print("Here is what the index looks like:")
-    print(tms_index.describe_index_stats())
+    print(get_index().describe_index_stats())
 
 
 ###########################
 # Functions for Server.py #
 ###########################
 
-# Function to query the Pinecone index
+# Function to embed a user query, reusing cached embeddings for repeated questions
+def embed_query(prompt:str):
+    if embedding_service.EMBEDDING_BATCHING:
+        return query_embedding_cache.get_or_compute(prompt, embedding_batcher.encode)
+    return query_embedding_cache.get_or_compute(prompt, get_embedding_model().encode)
+
+# Searches each routed namespace with its own top_k, in parallel, and merges the matches by score.
+# With no routes (an index ingested before per-source namespaces) the default namespace is searched
+def query_namespaces(vector, routes, top_k):
+    if not routes:
+        return list(get_index().query(vector=vector, top_k=top_k, include_metadata=True)['matches'])
+    index = get_index()
+    def search(route):
+        namespace, namespace_top_k = route
+        return index.query(vector=vector, top_k=namespace_top_k, include_metadata=True, namespace=namespace)['matches']
+    if len(routes) == 1:
+        results = [search(next(iter(routes.items())))]
+    else:
+        results = list(_namespace_pool.map(search, routes.items()))
+    merged = [match for matches in results for match in matches]
+    merged.sort(key=lambda match: match['score'], reverse=True)
+    return merged[:top_k]
+
+# Function to query the Pinecone index; returns the raw matches and the context built from them.
+# With a BM25 index available, dense and lexical results are fused with reciprocal rank fusion.
+# With RERANK_ENABLED, a larger candidate set is rescored by a cross-encoder unless the
+# deadline (a time.monotonic() value) leaves too little time
+def retrieve(prompt:str, k=5, deadline=None, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Returns {"matches", "context", "timings", "structured"}; timings holds seconds per retrieval
+    stage; the context is at most token_budget tokens. Schedule questions about specific courses
+    are answered from the TMS database instead (structured=True, no matches).
+    """
+    timings = {}
+    start = time.perf_counter()
+    schedule = tms_db.lookup(prompt)
+    timings["tms_lookup"] = time.perf_counter() - start
+    if schedule is not None:
+        return {"matches": [], "context": schedule, "timings": timings, "structured": True}
+
+    lexical_index = get_lexical_index() if HYBRID_RETRIEVAL else None
+    rerank = reranker.RERANK_ENABLED and reranker.has_time(deadline)
+    keep = max(k, reranker.RERANK_CANDIDATES) if rerank else k
+    candidates = keep * 2 if lexical_index is not None else keep
+
+    start = time.perf_counter()
+    query_vector = embed_query(prompt)
+    timings["embedding"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    routes = query_router.route(prompt, candidates, get_index().namespaces())
+    timings["routing"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches = query_namespaces(query_vector.tolist(), routes, candidates)
+    timings["vector_query"] = time.perf_counter() - start
+
+    if lexical_index is not None:
+        start = time.perf_counter()
+        lexical_matches = lexical_index.search(prompt, candidates, sources=set(routes) if routes else None)
+        matches = bm25_index.reciprocal_rank_fusion([matches, lexical_matches], keep)
+        timings["lexical_query"] = time.perf_counter() - start
+
+    if rerank:
+        matches, rerank_seconds = reranker.rerank(prompt, matches, min(k, reranker.RERANK_TOP_N), deadline)
+        if rerank_seconds is not None:
+            timings["rerank"] = rerank_seconds
+        else:
+            timings["rerank_skipped"] = True
+    elif reranker.RERANK_ENABLED:
+        timings["rerank_skipped"] = True
+    matches = matches[:k]
+
+    start = time.perf_counter()
+    context = assemble_context(matches, token_budget)
+    timings["context_assembly"] = time.perf_counter() - start
+    return {"matches": matches, "context": context, "timings": timings, "structured": False}
+
+# Function to build the retrieved context for the prompt
 def query_from_index(prompt:str, k=5) -> str:
-    result = index.query(
-        vector=embedding_model.encode(prompt).tolist(),
-        top_k=k,
-        include_metadata=True
-    )
-    matches = result['matches']
-    metadata_list = [match['metadata'] for match in matches]
-    return "\n".join(str(metadata) for metadata in metadata_list)
+    return retrieve(prompt, k)["context"]
 
 def is_valid_url(url: str) -> bool:
-    is_http = url.startswith("http")
-    has_invalid_extension = any(file in url.split('.')[-1] for file in ['asp', 'aspx', 'ashx'])
-    is_social_media = any(platform in url for platform in ["reddit", "tiktok", "linkedin", "instagram", "facebook", "twitter", "youtube"])
-    return is_http and not has_invalid_extension and not is_social_media
-
-# too slow, deprecating
-def fetch_content_from_urls(urls):
-    content = ""
+    return web_fetcher.is_valid_url(url)
+
+# Fetches drexel.edu pages concurrently, each with a timeout, within an overall deadline
+def fetch_content_from_urls(urls, deadline_seconds=web_fetcher.WEB_AUGMENT_DEADLINE):
     if type(urls) == str:
         urls = [urls]
-    for url in urls:
-        if is_valid_url(url) and "drexel.edu" in url:
-            print(url)
-            try:
-                response = requests.get(url)
-                if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    content += soup.get_text().replace("\n", "")
-            except requests.RequestException as e:
-                #print(f"Error fetching {url}: {e}")
-                continue
-    return content
+    pages = web_fetcher.fetch_pages(urls, deadline=time.monotonic() + deadline_seconds)
+    return "".join(pages[url] for url in urls if url in pages)
 
 def duckduckgo_search(query):
-    return DDGS().text(query, max_results=3, backend="lite")
+    return web_fetcher.search(query)
+
+# Search the web and fetch the result pages concurrently, bounded by one deadline
+def augment_with_web(query, exclude_urls=(), deadline_seconds=web_fetcher.WEB_AUGMENT_DEADLINE):
+    return web_fetcher.augment(query, exclude_urls=exclude_urls, deadline_seconds=deadline_seconds)
+
+# Same, as one section per search result so the prompt budget can drop whole results
+def augment_with_web_sections(query, exclude_urls=(), deadline_seconds=web_fetcher.WEB_AUGMENT_DEADLINE):
+    return web_fetcher.augment_sections(query, exclude_urls=exclude_urls, deadline_seconds=deadline_seconds)
 
 if __name__ == "__main__":
     pass
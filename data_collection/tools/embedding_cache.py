@@ -0,0 +1,116 @@
+import os
+import re
+import time
+import atexit
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+# Bounded LRU + TTL cache for query embeddings, keyed on normalized query text.
+# Set EMBEDDING_CACHE_PATH to persist the cache across restarts (.npz file).
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", 24 * 60 * 60))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+
+def normalize_query(text):
+    """Case-fold and collapse whitespace so trivially different queries share an entry."""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (created_at, vector)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def get(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, text, vector):
+        key = normalize_query(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, text, encode):
+        """Return the cached embedding for text, calling encode(text) on a miss."""
+        vector = self.get(text)
+        if vector is None:
+            vector = encode(text)
+            self.put(text, vector)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    # Persistence
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            created = np.array([self._entries[k][0] for k in keys], dtype=np.float64)
+            vectors = np.stack([self._entries[k][1] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        # Every gunicorn worker saves at exit; each writes its own temp file and the last rename wins
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        # Fixed-width unicode keys, so loading never needs pickle
+        np.savez(tmp_path, keys=np.array(keys, dtype=str), created=created, vectors=vectors)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        try:
+            data = np.load(self.path, allow_pickle=False)
+            keys = data["keys"]
+        except (OSError, ValueError) as e:
+            print(f"Could not load embedding cache from {self.path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, created_at, vector in zip(keys, data["created"], data["vectors"]):
+                if now - created_at <= self.ttl:
+                    vector = vector.astype(np.float32)
+                    vector.setflags(write=False)
+                    self._entries[str(key)] = (float(created_at), vector)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+query_embedding_cache = EmbeddingCache(path=EMBEDDING_CACHE_PATH)
+if EMBEDDING_CACHE_PATH:
+    atexit.register(query_embedding_cache.save)
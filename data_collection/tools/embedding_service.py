@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Dynamic micro-batching for query embeddings.
+#
+# Concurrent callers submit single strings; a worker thread collects requests for up to
+# EMBEDDING_BATCH_WAIT_MS (or EMBEDDING_MAX_BATCH items), runs one batched forward pass
+# and hands each caller its own vector back.
+
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "true").lower() in ("1", "true", "yes")
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", 32))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 2))
+# torch intra-op threads for the embedding model; unset leaves torch's default
+EMBEDDING_TORCH_THREADS = os.getenv("EMBEDDING_TORCH_THREADS")
+
+
+def configure_torch_threads(num_threads=EMBEDDING_TORCH_THREADS):
+    if not num_threads:
+        return
+    import torch
+    torch.set_num_threads(int(num_threads))
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode_batch, max_batch=EMBEDDING_MAX_BATCH, max_wait_ms=EMBEDDING_BATCH_WAIT_MS):
+        """encode_batch takes a list of strings and returns an array of vectors in the same order."""
+        self.encode_batch = encode_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, text):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.encode_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,133 @@
+import os
+import sys
+import numpy as np
+
+# ONNX Runtime backend for the all-MiniLM-L6-v2 query encoder.
+#
+# Runs an exported, int8-quantized copy of the model with the same WordPiece tokenizer,
+# mean pooling and L2 normalization as SentenceTransformer, without importing torch.
+# Select it with EMBEDDING_BACKEND=onnx once the model has been exported:
+#
+#   python -m data_collection.tools.onnx_encoder export   # needs torch + transformers, run once
+#   python -m data_collection.tools.onnx_encoder check    # cosine parity against the torch model
+#
+# CI exports the model and runs the same parity check as tests/test_onnx_encoder.py.
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join("data_collection", "onnx_models", "all-MiniLM-L6-v2"))
+ONNX_MODEL_FILE = "model.int8.onnx"
+ONNX_THREADS = os.getenv("EMBEDDING_ONNX_THREADS")
+HF_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_SEQ_LENGTH = 256  # same as SentenceTransformer('all-MiniLM-L6-v2').max_seq_length
+PARITY_TOLERANCE = 0.99  # minimum cosine similarity between ONNX and torch embeddings
+
+
+class OnnxEncoder:
+    """Drop-in for SentenceTransformer.encode on the query path."""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, num_threads=ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over non-padding tokens, then L2 normalization
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 384), dtype=np.float32)
+        vectors = np.vstack([self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+        vectors = vectors.astype(np.float32)
+        return vectors[0] if single else vectors
+
+
+def export_model(model_dir=ONNX_MODEL_DIR):
+    """Export all-MiniLM-L6-v2 to ONNX and quantize its weights to int8."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_NAME)
+    tokenizer.save_pretrained(model_dir)
+    model = AutoModel.from_pretrained(HF_MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(["warm up"], return_tensors="pt")
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ["input_ids", "attention_mask", "token_type_ids", "last_hidden_state"]}
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=14,
+    )
+    quantize_dynamic(fp32_path, os.path.join(model_dir, ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    print(f"Exported quantized model to {model_dir}")
+
+
+PARITY_QUERIES = [
+    "When is the add/drop deadline?",
+    "What are the prerequisites for CS 171?",
+    "Tell me about the co-op program in the College of Engineering",
+    "Which student organizations focus on entrepreneurship?",
+    "How much is tuition for graduate students in the LeBow College of Business?",
+    "CRN 21345",
+]
+
+
+def parity_similarities(model_dir=ONNX_MODEL_DIR, queries=PARITY_QUERIES):
+    """Cosine similarity between the ONNX and torch SentenceTransformer embedding of each query."""
+    from sentence_transformers import SentenceTransformer
+
+    torch_vectors = SentenceTransformer("all-MiniLM-L6-v2").encode(queries, normalize_embeddings=True)
+    onnx_vectors = OnnxEncoder(model_dir).encode(queries)
+    return (torch_vectors * onnx_vectors).sum(axis=1)
+
+
+def check_parity(model_dir=ONNX_MODEL_DIR, tolerance=PARITY_TOLERANCE):
+    """Compare ONNX embeddings with the torch SentenceTransformer on sample queries."""
+    similarities = parity_similarities(model_dir)
+    for query, similarity in zip(PARITY_QUERIES, similarities):
+        print(f"{similarity:.4f}  {query}")
+    print(f"min cosine similarity: {similarities.min():.4f} (tolerance {tolerance})")
+    return bool(similarities.min() >= tolerance)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command == "export":
+        export_model()
+    elif command == "check":
+        sys.exit(0 if check_parity() else 1)
+    else:
+        print("usage: python -m data_collection.tools.onnx_encoder [export|check]")
+        sys.exit(2)
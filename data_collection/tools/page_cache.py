@@ -0,0 +1,130 @@
+import os
+import time
+import sqlite3
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Disk-backed cache of extracted page text for live web fetches.
+#
+# Entries are keyed by normalized URL and stored in SQLite so every worker process shares
+# them. Fresh entries (younger than PAGE_CACHE_TTL) are served directly; stale ones are
+# revalidated with If-None-Match / If-Modified-Since. Failed fetches are cached for
+# PAGE_CACHE_NEGATIVE_TTL. The least recently used entries are evicted once the stored
+# text exceeds PAGE_CACHE_MAX_BYTES.
+
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", os.path.join("data_collection", "page_cache.sqlite3"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", 6 * 60 * 60))
+PAGE_CACHE_NEGATIVE_TTL = float(os.getenv("PAGE_CACHE_NEGATIVE_TTL", 10 * 60))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+
+def normalize_url(url):
+    """Lowercase scheme/host, drop fragments, tracking params and trailing slashes, sort the query."""
+    parts = urlsplit(url.strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith(TRACKING_PARAMS))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+class PageCache:
+    def __init__(self, path=PAGE_CACHE_PATH, ttl=PAGE_CACHE_TTL, negative_ttl=PAGE_CACHE_NEGATIVE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                ok INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )"""
+        )
+        self._connection().execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, url):
+        """Returns the cached row as a dict, or None."""
+        row = self._connection().execute(
+            "SELECT ok, text, etag, last_modified, fetched_at FROM pages WHERE url = ?", (normalize_url(url),)
+        ).fetchone()
+        if row is None:
+            return None
+        ok, text, etag, last_modified, fetched_at = row
+        return {"ok": bool(ok), "text": text, "etag": etag, "last_modified": last_modified, "fetched_at": fetched_at}
+
+    def is_fresh(self, entry):
+        ttl = self.ttl if entry["ok"] else self.negative_ttl
+        return time.time() - entry["fetched_at"] <= ttl
+
+    def touch(self, url, refreshed=False):
+        now = time.time()
+        if refreshed:
+            self._connection().execute("UPDATE pages SET accessed_at = ?, fetched_at = ? WHERE url = ?", (now, now, normalize_url(url)))
+        else:
+            self._connection().execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (now, normalize_url(url)))
+
+    def put(self, url, text, etag=None, last_modified=None, ok=True):
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        self._connection().execute(
+            "INSERT OR REPLACE INTO pages (url, ok, text, etag, last_modified, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (normalize_url(url), int(ok), text, etag, last_modified, now, now, size),
+        )
+        self._evict()
+
+    def put_failure(self, url):
+        self.put(url, "", ok=False)
+
+    def _evict(self):
+        connection = self._connection()
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for url, size in connection.execute("SELECT url, size FROM pages ORDER BY accessed_at ASC"):
+            victims.append((url,))
+            freed += size
+            if freed >= excess:
+                break
+        connection.executemany("DELETE FROM pages WHERE url = ?", victims)
+
+    def stats(self):
+        count, total = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    global _page_cache
+    if _page_cache is None:
+        with _page_cache_lock:
+            if _page_cache is None:
+                _page_cache = PageCache()
+    return _page_cache
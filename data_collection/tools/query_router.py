@@ -0,0 +1,68 @@
+import os
+import re
+
+# Routes a query to the index namespaces (one per ingested source) worth searching.
+#
+# A small set of local keyword rules decides which sources a question is about; each
+# routed namespace is searched with the full top_k, and the official pages namespace is
+# always searched with a few extra slots as a backstop. Queries no rule matches search
+# every namespace with a reduced top_k. Results are merged by score in data_manager.
+
+NAMESPACE_ROUTING = os.getenv("NAMESPACE_ROUTING", "true").lower() in ("1", "true", "yes")
+ROUTING_BACKSTOP_K = int(os.getenv("ROUTING_BACKSTOP_K", 2))
+
+# Namespace names are the context_assembler source names
+NAMESPACES = ["course", "tms", "major", "minor", "graduate_program", "student_org", "college", "official_page"]
+BACKSTOP_NAMESPACE = "official_page"
+# Vectors ingested before per-source namespaces; searched alongside the routed ones until deleted
+DEFAULT_NAMESPACE = ""
+
+COURSE_CODE = re.compile(r"\b[a-z]{2,4}[ -]?\d{3}\b", re.IGNORECASE)
+_CLASS_WORDS = re.compile(r"\b(courses?|class(es)?|sections?|labs?|recitations?)\b", re.IGNORECASE)
+
+RULES = {
+    "course": re.compile(r"\b(courses?|class(es)?|prereq(uisite)?s?|credits?|electives?|syllabus)\b", re.IGNORECASE),
+    "tms": re.compile(r"\b(sections?|crns?|instructors?|professors?|teach(es|ing)?|taught|meets?|meeting|schedule[ds]?|"
+                      r"times?|online|in[- ]person|hybrid|this (term|quarter)|(fall|winter|spring|summer) (term|quarter))\b", re.IGNORECASE),
+    "major": re.compile(r"\b(majors?|bachelor'?s?|bs|ba|b\.s\.|concentrations?|degree requirements?|plan of study)\b", re.IGNORECASE),
+    "minor": re.compile(r"\bminors?\b", re.IGNORECASE),
+    "graduate_program": re.compile(r"\b(graduate|grad|master'?s?|ms|m\.s\.|mba|ph\.?d|doctoral|doctorate|certificates?)\b", re.IGNORECASE),
+    "student_org": re.compile(r"\b(clubs?|organi[sz]ations?|orgs?|societ(y|ies)|fraternit(y|ies)|sororit(y|ies)|student groups?)\b", re.IGNORECASE),
+    "college": re.compile(r"\b(colleges?|school of|departments?)\b", re.IGNORECASE),
+}
+
+
+def classify(query):
+    """The set of namespaces the query is about; empty when no rule matches."""
+    namespaces = {namespace for namespace, pattern in RULES.items() if pattern.search(query)}
+    has_course_code = COURSE_CODE.search(query) is not None
+    if has_course_code:
+        namespaces.add("course")
+    # Scheduling words only point at TMS sections when the question is about a class
+    if "tms" in namespaces and not (has_course_code or _CLASS_WORDS.search(query)):
+        namespaces.discard("tms")
+    return namespaces
+
+
+def route(query, top_k, available=None):
+    """
+    Returns {namespace: top_k} to search, limited to the namespaces in available (if given).
+    An empty dict means the index has no per-source namespaces yet, so search it unpartitioned.
+    While the default namespace still holds vectors from before the migration it is always
+    searched too, since any source may still live there.
+    """
+    candidates = [namespace for namespace in NAMESPACES if available is None or namespace in available]
+    if not candidates:
+        return {}
+    if not NAMESPACE_ROUTING:
+        routed = {namespace: top_k for namespace in candidates}
+    else:
+        routed = {namespace: top_k for namespace in classify(query) if namespace in candidates}
+        if not routed:
+            per_namespace = max(ROUTING_BACKSTOP_K, -(-top_k // 2))
+            routed = {namespace: per_namespace for namespace in candidates}
+        elif BACKSTOP_NAMESPACE in candidates:
+            routed.setdefault(BACKSTOP_NAMESPACE, ROUTING_BACKSTOP_K)
+    if available is not None and DEFAULT_NAMESPACE in available:
+        routed[DEFAULT_NAMESPACE] = top_k
+    return routed
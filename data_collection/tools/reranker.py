@@ -0,0 +1,64 @@
+import os
+import time
+import threading
+from data_collection.tools.bm25_index import document_text
+
+# Optional cross-encoder rerank stage for retrieve().
+#
+# retrieve() over-fetches RERANK_CANDIDATES matches, the cross-encoder rescores them in
+# batches on CPU, and only the best RERANK_TOP_N go into the prompt. Reranking is skipped
+# when the time left before the request's deadline is shorter than the expected rerank
+# time (a moving average of recent reranks, not counting model loading). Every skip decays
+# the estimate a little, so after a slow spell reranking is tried again and re-measured.
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 30))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", 3))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))
+RERANK_INITIAL_ESTIMATE = float(os.getenv("RERANK_INITIAL_ESTIMATE_MS", 150)) / 1000
+RERANK_SKIP_DECAY = float(os.getenv("RERANK_SKIP_DECAY", 0.9))
+
+_model = None
+_model_lock = threading.Lock()
+_expected_seconds = RERANK_INITIAL_ESTIMATE
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL, max_length=256)
+    return _model
+
+
+def has_time(deadline):
+    global _expected_seconds
+    if deadline is None or deadline - time.monotonic() >= _expected_seconds:
+        return True
+    _expected_seconds *= RERANK_SKIP_DECAY
+    return False
+
+
+def rerank(query, matches, top_n=RERANK_TOP_N, deadline=None):
+    """
+    Returns (matches, rerank_seconds). rerank_seconds is None when reranking was skipped
+    because of the deadline, in which case matches are returned as given.
+    """
+    global _expected_seconds
+    if len(matches) <= 1 or not has_time(deadline):
+        return list(matches), None
+
+    model = get_model()  # loading time stays out of the estimate (lifecycle.warm_up normally does it)
+    start = time.perf_counter()
+    pairs = [(query, document_text(match["metadata"] or {})) for match in matches]
+    scores = model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+    ranked = sorted(zip(matches, scores), key=lambda pair: float(pair[1]), reverse=True)
+    reranked = []
+    for match, score in ranked[:top_n]:
+        reranked.append({"id": match["id"], "score": float(match["score"]), "metadata": match["metadata"], "rerank_score": float(score)})
+    elapsed = time.perf_counter() - start
+    _expected_seconds = 0.8 * _expected_seconds + 0.2 * elapsed
+    return reranked, elapsed
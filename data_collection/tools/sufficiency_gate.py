@@ -0,0 +1,66 @@
+import os
+import re
+import json
+
+# Local decision on whether retrieved context is enough to answer a query, used by
+# improve_rag instead of asking the LLM. Works from signals retrieval already has:
+# the top match score, the gap between the top score and the rest of the top-k, and how
+# many of the query's content terms appear in the retrieved text.
+#
+# Thresholds come from SUFFICIENCY_THRESHOLDS_PATH (written by
+# calibrate_sufficiency_gate.py) when present, else from the env vars below.
+
+SUFFICIENCY_THRESHOLDS_PATH = os.getenv("SUFFICIENCY_THRESHOLDS_PATH", os.path.join("data_collection", "sufficiency_thresholds.json"))
+
+DEFAULT_THRESHOLDS = {
+    "min_top_score": float(os.getenv("SUFFICIENCY_MIN_TOP_SCORE", 0.45)),
+    "strong_top_score": float(os.getenv("SUFFICIENCY_STRONG_TOP_SCORE", 0.65)),
+    "min_score_gap": float(os.getenv("SUFFICIENCY_MIN_SCORE_GAP", 0.0)),
+    "min_term_coverage": float(os.getenv("SUFFICIENCY_MIN_TERM_COVERAGE", 0.6)),
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "can", "do", "does", "drexel", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "university", "what", "when", "where", "which",
+    "who", "why", "will", "with", "you", "your", "about", "there", "this", "that", "tell", "any", "get",
+}
+
+
+def load_thresholds(path=SUFFICIENCY_THRESHOLDS_PATH):
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            thresholds.update(json.load(f))
+    return thresholds
+
+
+def query_terms(query):
+    """Lowercased content terms; numbers are kept so course numbers and CRNs count."""
+    return {term for term in re.findall(r"[a-z0-9]+", query.lower()) if term not in STOPWORDS and (len(term) > 1 or term.isdigit())}
+
+
+def compute_signals(query, matches, context):
+    scores = sorted((float(match["score"]) for match in matches), reverse=True)
+    top_score = scores[0] if scores else 0.0
+    rest = scores[1:]
+    score_gap = top_score - (sum(rest) / len(rest)) if rest else top_score
+
+    terms = query_terms(query)
+    context_terms = set(re.findall(r"[a-z0-9]+", context.lower()))
+    term_coverage = len(terms & context_terms) / len(terms) if terms else 1.0
+
+    return {"top_score": top_score, "score_gap": score_gap, "term_coverage": term_coverage}
+
+
+def is_sufficient(signals, thresholds=None):
+    thresholds = thresholds or _thresholds
+    if signals["top_score"] >= thresholds["strong_top_score"] and signals["term_coverage"] >= thresholds["min_term_coverage"] / 2:
+        return True
+    return (
+        signals["top_score"] >= thresholds["min_top_score"]
+        and signals["score_gap"] >= thresholds["min_score_gap"]
+        and signals["term_coverage"] >= thresholds["min_term_coverage"]
+    )
+
+
+_thresholds = load_thresholds()
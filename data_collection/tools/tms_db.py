@@ -0,0 +1,170 @@
+import os
+import re
+import sys
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from data_collection.tools import query_router
+
+# Exact Term Master Schedule lookups for /query from the class-scheduler SQLite DB.
+#
+# Schedule questions about specific courses ("when does CS 171 meet on Tuesdays", "who
+# teaches CS 260") are answered from the winterTms table with parameterized queries on
+# (SubjectCode, CourseNo) instead of vector search, and the sections are put in the prompt
+# as a compact table. Connections are read-only and pooled. Build the lookup indexes once
+# with: python -m data_collection.tools.tms_db index
+
+TMS_DB_PATH = os.getenv("TMS_DB_PATH", os.path.join("course_scheduler", "winterTms.db"))
+TMS_TABLE = os.getenv("TMS_TABLE", "winterTms")
+TMS_DB_POOL_SIZE = int(os.getenv("TMS_DB_POOL_SIZE", 4))
+TMS_MAX_ROWS = int(os.getenv("TMS_MAX_ROWS", 25))
+TMS_STRUCTURED_LOOKUP = os.getenv("TMS_STRUCTURED_LOOKUP", "true").lower() in ("1", "true", "yes")
+
+# (column, table header) in output order; column names are those of the TMS CSV export
+COLUMNS = [
+    ('"SubjectCode"', "Subject"),
+    ('"CourseNo\\."', "No"),
+    ('"CourseTitle"', "Title"),
+    ('"Sec"', "Sec"),
+    ('"CRN"', "CRN"),
+    ('"InstrType"', "Type"),
+    ('"InstrMethod"', "Method"),
+    ('"Days_Time"', "Days"),
+    ('"Days_Time1"', "Time"),
+    ('"Instructor"', "Instructor"),
+]
+
+COURSE = re.compile(r"\b([a-z]{2,4})[ -]?(\d{3})\b", re.IGNORECASE)
+CRN = re.compile(r"\bcrn:?\s*#?\s*(\d{5})\b", re.IGNORECASE)
+DAYS = [
+    ("M", re.compile(r"\bmon(day)?s?\b", re.IGNORECASE)),
+    ("T", re.compile(r"\btue(s|sday)?s?\b", re.IGNORECASE)),
+    ("W", re.compile(r"\bwed(nesday)?s?\b", re.IGNORECASE)),
+    ("R", re.compile(r"\bthu(rs|rsday)?s?\b", re.IGNORECASE)),
+    ("F", re.compile(r"\bfri(day)?s?\b", re.IGNORECASE)),
+]
+
+
+class ConnectionPool:
+    """A fixed number of read-only SQLite connections shared by request threads."""
+
+    def __init__(self, path, size=TMS_DB_POOL_SIZE):
+        self.path = path
+        self._connections = queue.Queue()
+        for _ in range(size):
+            connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            connection.execute("PRAGMA query_only=ON")
+            self._connections.put(connection)
+
+    @contextmanager
+    def connection(self, timeout=5):
+        connection = self._connections.get(timeout=timeout)
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+
+_pool = None
+_pool_checked = False
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The shared pool, or None if the TMS database isn't present."""
+    global _pool, _pool_checked
+    if not _pool_checked:
+        with _pool_lock:
+            if not _pool_checked:
+                if os.path.exists(TMS_DB_PATH):
+                    _pool = ConnectionPool(TMS_DB_PATH)
+                else:
+                    print(f"TMS database not found at {TMS_DB_PATH}; schedule questions use vector search")
+                _pool_checked = True
+    return _pool
+
+
+def parse_schedule_query(query):
+    """Returns {"courses", "crns", "days"} for a schedule question about specific sections, or None."""
+    crns = CRN.findall(query)
+    if not crns and "tms" not in query_router.classify(query):
+        return None
+    courses = [(subject.upper(), number) for subject, number in COURSE.findall(query)]
+    if not courses and not crns:
+        return None
+    days = [letter for letter, pattern in DAYS if pattern.search(query)]
+    return {"courses": courses, "crns": crns, "days": days}
+
+
+def find_sections(courses=(), crns=(), days=(), limit=TMS_MAX_ROWS):
+    """Returns (rows, total) for sections of the given courses / CRNs that meet on all of days."""
+    pool = get_pool()
+    if pool is None:
+        return [], 0
+    matches = []
+    params = []
+    for subject, number in courses:
+        matches.append('("SubjectCode" = ? AND "CourseNo\\." = ?)')
+        params += [subject, number]
+    for crn in crns:
+        matches.append('"CRN" = ?')
+        params.append(crn)
+    where = "(" + " OR ".join(matches) + ")"
+    for day in days:
+        where += ' AND "Days_Time" LIKE ?'
+        params.append(f"%{day}%")
+
+    columns = ", ".join(column for column, _ in COLUMNS)
+    with pool.connection() as connection:
+        total = connection.execute(f"SELECT COUNT(*) FROM {TMS_TABLE} WHERE {where}", params).fetchone()[0]
+        rows = connection.execute(
+            f'SELECT {columns} FROM {TMS_TABLE} WHERE {where} ORDER BY "SubjectCode", "CourseNo\\.", "Sec" LIMIT ?',
+            params + [limit]
+        ).fetchall()
+    return rows, total
+
+
+def format_sections(rows, total):
+    """Compact pipe-separated table of sections for the prompt."""
+    headers = [header for _, header in COLUMNS]
+    lines = ["## Term Master Schedule sections", " | ".join(headers)]
+    for row in rows:
+        lines.append(" | ".join("" if value is None else str(value).strip() for value in row))
+    if total > len(rows):
+        lines.append(f"({total - len(rows)} more matching sections not shown)")
+    return "\n".join(lines) + "\n"
+
+
+def lookup(query):
+    """The schedule table for a schedule question about specific courses, or None to fall back to retrieval."""
+    if not TMS_STRUCTURED_LOOKUP:
+        return None
+    parsed = parse_schedule_query(query)
+    if parsed is None:
+        return None
+    try:
+        rows, total = find_sections(**parsed)
+    except (sqlite3.Error, queue.Empty) as e:
+        print(f"TMS lookup failed: {e}")
+        return None
+    if not rows:
+        return None
+    return format_sections(rows, total)
+
+
+def create_indexes(path=TMS_DB_PATH):
+    """One-off: add the indexes lookup() relies on (the server itself only opens the DB read-only)."""
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {TMS_TABLE}_course ON {TMS_TABLE} ("SubjectCode", "CourseNo\\.")')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {TMS_TABLE}_crn ON {TMS_TABLE} ("CRN")')
+    connection.close()
+    print(f"Indexed {TMS_TABLE} in {path}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["index"]:
+        create_indexes()
+    else:
+        print("usage: python -m data_collection.tools.tms_db index")
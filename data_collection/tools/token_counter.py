@@ -0,0 +1,32 @@
+import os
+from functools import lru_cache
+
+# Token counting with the chat model's own encoding (tiktoken), shared by prompt-building code.
+
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o-mini")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=TOKENIZER_MODEL):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text, model=TOKENIZER_MODEL):
+    if not text:
+        return 0
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=TOKENIZER_MODEL):
+    """Cut text to at most max_tokens tokens, on a token boundary."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
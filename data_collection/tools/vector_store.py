@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import numpy as np
+
+# Vector store backends for data_manager.
+#
+# Every backend exposes the same small surface that the Pinecone `Index` object
+# already gives us: upsert(vectors=[...], namespace=...), query(vector=..., top_k=...,
+# include_metadata=..., namespace=..., filter=...), describe_index_stats(), plus flush()
+# so ingestion can persist local snapshots, version() so caches can tell when the index
+# has been re-ingested and namespaces() listing the non-empty namespaces.
+#
+# Select a backend with the VECTOR_STORE env var ("pinecone" or "local").
+
+DIMENSION = 384
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join("data_collection", "index_snapshots"))
+LOCAL_INDEX_ANN = os.getenv("LOCAL_INDEX_ANN", "false").lower() in ("1", "true", "yes")
+# How often (seconds) the Pinecone backend re-reads index stats to detect re-ingestion
+PINECONE_VERSION_REFRESH = float(os.getenv("PINECONE_VERSION_REFRESH", 300))
+# Ingestion stamps a Pinecone index with a version marker vector in a namespace of its own
+INDEX_META_NAMESPACE = "__meta__"
+INDEX_VERSION_ID = "index_version"
+
+_pinecone_client = None
+
+
+def pinecone_client():
+    """Create the Pinecone client on first use so the local backend never imports pinecone."""
+    global _pinecone_client
+    if _pinecone_client is None:
+        from pinecone import Pinecone
+        _pinecone_client = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    return _pinecone_client
+
+
+class PineconeIndex:
+    """Thin wrapper over a Pinecone index so it matches the local backend's interface."""
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+        self._index = pinecone_client().Index(index_name)
+        self._writes = 0
+        self._version = None
+        self._namespaces = set()
+        self._version_checked_at = 0.0
+
+    def upsert(self, vectors, **kwargs):
+        vectors = [dict(v, values=np.asarray(v['values'], dtype=np.float32).tolist()) for v in vectors]
+        self._writes += 1
+        return self._index.upsert(vectors=vectors, **kwargs)
+
+    def query(self, vector, top_k=5, include_metadata=True, **kwargs):
+        return self._index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs)
+
+    def describe_index_stats(self):
+        return self._index.describe_index_stats()
+
+    def flush(self):
+        """
+        Pinecone persists on upsert; this writes a new version marker so other processes (the
+        server) can tell the index was re-ingested even when the vector count didn't change.
+        """
+        marker = [1.0] + [0.0] * (DIMENSION - 1)  # Pinecone rejects all-zero vectors
+        self._index.upsert(
+            vectors=[{"id": INDEX_VERSION_ID, "values": marker, "metadata": {"version": str(time.time_ns())}}],
+            namespace=INDEX_META_NAMESPACE
+        )
+        self._writes += 1
+
+    def _read_version_marker(self):
+        vectors = self._index.fetch(ids=[INDEX_VERSION_ID], namespace=INDEX_META_NAMESPACE).vectors
+        marker = vectors.get(INDEX_VERSION_ID)
+        return marker.metadata["version"] if marker is not None and marker.metadata else None
+
+    def _refresh_stats(self):
+        """Other processes can only be observed through the index, re-read every PINECONE_VERSION_REFRESH seconds."""
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at > PINECONE_VERSION_REFRESH:
+            try:
+                stats = self.describe_index_stats()
+                # Indexes ingested before the marker existed fall back to the vector count
+                self._version = self._read_version_marker() or f"count-{stats['total_vector_count']}"
+                self._namespaces = {name for name, namespace in stats['namespaces'].items()
+                                    if namespace['vector_count'] and name != INDEX_META_NAMESPACE}
+            except Exception as e:
+                print(f"Could not read stats for index '{self.index_name}': {e}")
+            self._version_checked_at = now
+
+    def version(self):
+        """Stamp that changes when the index is re-ingested: the ingestion marker plus this process's own writes."""
+        self._refresh_stats()
+        return f"{self._version}:{self._writes}"
+
+    def namespaces(self):
+        self._refresh_stats()
+        return self._namespaces
+
+
+class LocalIndex:
+    """
+    In-process index over L2-normalized float32 vectors.
+
+    A snapshot is a directory holding vectors.npy (memory-mapped on load), ids.json,
+    metadata.json and a version stamp, plus hnsw.bin when an approximate index has been
+    built. Queries are exact brute-force dot products unless approximate=True and hnswlib
+    is installed.
+
+    The vectors above form the default namespace (""); every other namespace is a LocalIndex
+    of its own under namespaces/<name>, so a query only scans its own partition.
+    """
+
+    def __init__(self, path, approximate=False):
+        self.path = path
+        self.approximate = approximate
+        self.ids = []
+        self.metadata = []
+        self.vectors = np.zeros((0, DIMENSION), dtype=np.float32)
+        self._positions = {}
+        self._staged = []
+        self._ann = None
+        self._version = "empty"
+        self._children = {}  # namespace -> LocalIndex
+        if os.path.exists(os.path.join(path, "vectors.npy")):
+            self.load()
+        namespaces_dir = os.path.join(path, "namespaces")
+        if os.path.isdir(namespaces_dir):
+            for name in sorted(os.listdir(namespaces_dir)):
+                self._children[name] = LocalIndex(os.path.join(namespaces_dir, name), approximate)
+
+    def namespace(self, name):
+        """The partition for namespace name, created on first write."""
+        if not name:
+            return self
+        if name not in self._children:
+            self._children[name] = LocalIndex(os.path.join(self.path, "namespaces", name), self.approximate)
+        return self._children[name]
+
+    def namespaces(self):
+        names = {name for name, child in self._children.items() if child.ids or child._staged}
+        if self.ids or self._staged:
+            names.add("")
+        return names
+
+    # Snapshot I/O
+    def load(self):
+        self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(self.path, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        with open(os.path.join(self.path, "metadata.json"), "r", encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self._positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self._staged = []
+        self._ann = None
+        version_path = os.path.join(self.path, "version")
+        if os.path.exists(version_path):
+            with open(version_path, "r") as f:
+                self._version = f.read().strip()
+        else:
+            self._version = str(os.path.getmtime(os.path.join(self.path, "vectors.npy")))
+        if self.approximate:
+            self._load_ann()
+
+    def flush(self):
+        """Write the current contents (and every namespace's) to the snapshot directory."""
+        for child in self._children.values():
+            child.flush()
+        self._consolidate()
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, "vectors.tmp.npy")
+        np.save(tmp_path, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(tmp_path, os.path.join(self.path, "vectors.npy"))
+        with open(os.path.join(self.path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        with open(os.path.join(self.path, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f)
+        with open(os.path.join(self.path, "version"), "w") as f:
+            f.write(str(time.time_ns()))
+        if self.approximate:
+            self._build_ann()
+            if self._ann is not None:
+                self._ann.save_index(os.path.join(self.path, "hnsw.bin"))
+        # Re-open memory-mapped so the heap copy can be released
+        self.load()
+
+    # Write path
+    def upsert(self, vectors, namespace="", **kwargs):
+        if namespace:
+            return self.namespace(namespace).upsert(vectors)
+        for item in vectors:
+            self._staged.append((item['id'], np.asarray(item['values'], dtype=np.float32), item.get('metadata', {})))
+        self._version = f"staged-{time.time_ns()}"
+        return {"upserted_count": len(vectors)}
+
+    def _consolidate(self):
+        if not self._staged:
+            return
+        vectors = np.array(self.vectors, dtype=np.float32)  # writable copy of the mmap
+        new_rows = []
+        for vector_id, values, metadata in self._staged:
+            values = _normalize(values)
+            position = self._positions.get(vector_id)
+            if position is None:
+                self._positions[vector_id] = len(self.ids)
+                self.ids.append(vector_id)
+                self.metadata.append(metadata)
+                new_rows.append(values)
+            elif position < len(vectors):
+                vectors[position] = values
+                self.metadata[position] = metadata
+            else:
+                new_rows[position - len(vectors)] = values
+                self.metadata[position] = metadata
+        if new_rows:
+            vectors = np.vstack([vectors, np.stack(new_rows)])
+        self.vectors = vectors
+        self._staged = []
+        self._ann = None
+
+    # Read path
+    def query(self, vector, top_k=5, include_metadata=True, namespace="", filter=None, **kwargs):
+        if namespace:
+            if namespace not in self._children:
+                return {"matches": [], "namespace": namespace}
+            return dict(self._children[namespace].query(vector, top_k, include_metadata, filter=filter), namespace=namespace)
+        self._consolidate()
+        if len(self.ids) == 0:
+            return {"matches": [], "namespace": ""}
+        query_vector = _normalize(np.asarray(vector, dtype=np.float32))
+
+        if filter:
+            # Exact search over the rows that pass the metadata filter
+            allowed = np.array([i for i, metadata in enumerate(self.metadata) if matches_filter(metadata, filter)], dtype=np.int64)
+            top_k = min(top_k, len(allowed))
+            if top_k == 0:
+                return {"matches": [], "namespace": ""}
+            similarities = self.vectors[allowed] @ query_vector
+            order = np.argpartition(-similarities, top_k - 1)[:top_k]
+            order = order[np.argsort(-similarities[order])]
+            positions, scores = allowed[order], similarities[order]
+        else:
+            top_k = min(top_k, len(self.ids))
+            if self.approximate and self._ann is None:
+                self._build_ann()
+            if self._ann is not None:
+                labels, distances = self._ann.knn_query(query_vector, k=top_k)
+                positions, scores = labels[0], 1.0 - distances[0]
+            else:
+                similarities = self.vectors @ query_vector
+                positions = np.argpartition(-similarities, top_k - 1)[:top_k]
+                positions = positions[np.argsort(-similarities[positions])]
+                scores = similarities[positions]
+
+        matches = []
+        for position, score in zip(positions, scores):
+            match = {"id": self.ids[position], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = self.metadata[position]
+            matches.append(match)
+        return {"matches": matches, "namespace": ""}
+
+    def describe_index_stats(self):
+        self._consolidate()
+        namespaces = {"": {"vector_count": len(self.ids)}} if self.ids else {}
+        for name, child in self._children.items():
+            namespaces[name] = {"vector_count": child.describe_index_stats()["total_vector_count"]}
+        return {
+            "dimension": DIMENSION,
+            "total_vector_count": sum(namespace["vector_count"] for namespace in namespaces.values()),
+            "namespaces": namespaces,
+            "approximate": self._ann is not None,
+        }
+
+    def version(self):
+        if not self._children:
+            return self._version
+        return ":".join([self._version] + [child.version() for _, child in sorted(self._children.items())])
+
+    # Approximate (HNSW) index
+    def _build_ann(self):
+        try:
+            import hnswlib
+        except ImportError:
+            return
+        ann = hnswlib.Index(space="cosine", dim=DIMENSION)
+        ann.init_index(max_elements=max(len(self.ids), 1), ef_construction=200, M=16)
+        if len(self.ids):
+            ann.add_items(np.asarray(self.vectors), np.arange(len(self.ids)))
+        ann.set_ef(64)
+        self._ann = ann
+
+    def _load_ann(self):
+        ann_path = os.path.join(self.path, "hnsw.bin")
+        if not os.path.exists(ann_path):
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            return
+        ann = hnswlib.Index(space="cosine", dim=DIMENSION)
+        ann.load_index(ann_path, max_elements=len(self.ids))
+        ann.set_ef(64)
+        self._ann = ann
+
+
+def matches_filter(metadata, filter):
+    """Evaluate the subset of Pinecone's metadata filter language we use: {field: value | {$eq|$ne|$in|$nin: ...}}."""
+    for field, condition in filter.items():
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$eq" and value != operand:
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+            if operator == "$in" and value not in operand:
+                return False
+            if operator == "$nin" and value in operand:
+                return False
+    return True
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def open_index(index_name, backend=None):
+    """Open the named index on the configured backend."""
+    backend = backend or VECTOR_STORE
+    if backend == "local":
+        start = time.perf_counter()
+        local_index = LocalIndex(os.path.join(LOCAL_INDEX_DIR, index_name), approximate=LOCAL_INDEX_ANN)
+        vector_count = local_index.describe_index_stats()["total_vector_count"]
+        print(f"Loaded local index '{index_name}' ({vector_count} vectors) in {time.perf_counter() - start:.2f}s")
+        return local_index
+    if backend == "pinecone":
+        return PineconeIndex(index_name)
+    raise ValueError(f"Unknown vector store backend: {backend}")
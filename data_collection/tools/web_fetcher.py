@@ -0,0 +1,149 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from duckduckgo_search import DDGS
+from data_collection.tools import page_cache
+
+# Concurrent, deadline-bounded web fetching for RAG augmentation.
+#
+# Search and page fetches run on a shared thread pool over a pooled requests.Session.
+# Every HTTP request has WEB_REQUEST_TIMEOUT, and each augmentation call has an overall
+# deadline; whatever hasn't come back by then is discarded. Page text is served from
+# page_cache.py when possible.
+
+WEB_FETCH_WORKERS = int(os.getenv("WEB_FETCH_WORKERS", 16))
+WEB_REQUEST_TIMEOUT = float(os.getenv("WEB_REQUEST_TIMEOUT", 2.0))
+WEB_AUGMENT_DEADLINE = float(os.getenv("WEB_AUGMENT_DEADLINE", 3.0))
+WEB_SEARCH_RESULTS = int(os.getenv("WEB_SEARCH_RESULTS", 3))
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+session = requests.Session()
+session.headers.update(headers)
+_adapter = HTTPAdapter(pool_connections=WEB_FETCH_WORKERS, pool_maxsize=WEB_FETCH_WORKERS)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+executor = ThreadPoolExecutor(max_workers=WEB_FETCH_WORKERS, thread_name_prefix="web-fetch")
+
+
+def is_valid_url(url: str) -> bool:
+    is_http = url.startswith("http")
+    has_invalid_extension = any(file in url.split('.')[-1] for file in ['asp', 'aspx', 'ashx'])
+    is_social_media = any(platform in url for platform in ["reddit", "tiktok", "linkedin", "instagram", "facebook", "twitter", "youtube"])
+    return is_http and not has_invalid_extension and not is_social_media
+
+
+def should_fetch(url: str) -> bool:
+    return is_valid_url(url) and "drexel.edu" in url
+
+
+def fetch_page_text(url, timeout=WEB_REQUEST_TIMEOUT):
+    """Return a page's visible text, or '' on any failure. Goes through the shared page cache."""
+    if not PAGE_CACHE_ENABLED:
+        return _download_page_text(url, timeout)[0]
+
+    cache = page_cache.get_page_cache()
+    entry = cache.get(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.hits += 1
+        cache.touch(url)
+        return entry["text"]
+
+    conditional_headers = {}
+    if entry is not None and entry["ok"]:
+        if entry["etag"]:
+            conditional_headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            conditional_headers["If-Modified-Since"] = entry["last_modified"]
+
+    text, response = _download_page_text(url, timeout, conditional_headers)
+    if response is not None and response.status_code == 304 and entry is not None:
+        cache.revalidated += 1
+        cache.touch(url, refreshed=True)
+        return entry["text"]
+    if response is None or response.status_code != 200:
+        if entry is not None and entry["ok"]:
+            # Network error or e.g. a 5xx while revalidating: keep the previous copy and
+            # only record the check, so a transient failure doesn't replace good text
+            cache.touch(url, refreshed=True)
+            return entry["text"]
+        cache.put_failure(url)
+        return ""
+    cache.misses += 1
+    cache.put(url, text, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+    return text
+
+
+def _download_page_text(url, timeout, extra_headers=None):
+    """Returns (text, response); response is None if the request failed outright."""
+    try:
+        response = session.get(url, timeout=timeout, headers=extra_headers)
+    except requests.RequestException:
+        return "", None
+    if response.status_code != 200:
+        return "", response
+    soup = BeautifulSoup(response.text, 'html.parser')
+    return soup.get_text().replace("\n", ""), response
+
+
+def search(query, max_results=WEB_SEARCH_RESULTS):
+    return DDGS(timeout=int(max(WEB_REQUEST_TIMEOUT, 1))).text(query, max_results=max_results, backend="lite")
+
+
+def _collect(futures, deadline):
+    """Wait for futures until deadline; returns {future: result} for those that finished in time."""
+    results = {}
+    pending = set(futures)
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                results[future] = future.result()
+    for future in pending:
+        future.cancel()  # only stops fetches that haven't started; late results are ignored
+    return results
+
+
+def fetch_pages(urls, deadline=None, timeout=WEB_REQUEST_TIMEOUT):
+    """Fetch urls concurrently; returns {url: text} for pages that arrived before the deadline."""
+    deadline = deadline or time.monotonic() + WEB_AUGMENT_DEADLINE
+    futures = {executor.submit(fetch_page_text, url, timeout): url for url in dict.fromkeys(urls) if should_fetch(url)}
+    results = _collect(futures, deadline)
+    return {futures[future]: text for future, text in results.items() if text}
+
+
+def augment_sections(query, exclude_urls=(), deadline_seconds=WEB_AUGMENT_DEADLINE):
+    """
+    Search the web for query and fetch the result pages, all within deadline_seconds.
+    Returns one context section per search result in rank order (its snippet plus page
+    text and URL for pages not already in exclude_urls).
+    """
+    deadline = time.monotonic() + deadline_seconds
+    search_future = executor.submit(search, query)
+    search_results = _collect([search_future], deadline).get(search_future) or []
+
+    urls = [result["href"] for result in search_results if result["href"] not in exclude_urls]
+    pages = fetch_pages(urls, deadline)
+
+    sections = []
+    for result in search_results:
+        section = result["body"]
+        if result["href"] in pages:
+            section += pages[result["href"]] + result["href"]
+        sections.append(section)
+    return sections
+
+
+def augment(query, exclude_urls=(), deadline_seconds=WEB_AUGMENT_DEADLINE):
+    """The augment_sections() results as one block of extra context text."""
+    return "".join(augment_sections(query, exclude_urls, deadline_seconds))
@@ -0,0 +1,55 @@
+import os
+import gc
+
+# Production entry point: gunicorn -c gunicorn.conf.py
+#
+# The app is preloaded in the master: server.py is imported and the embedding model and
+# index client are loaded there before any worker is forked, so the workers share the
+# model weights copy-on-write instead of each loading their own copy. The warm-up encode
+# and query run in each worker after the fork (post_fork): running torch inference in the
+# master would start its OpenMP thread pool, which doesn't survive fork. A background
+# warm-up thread wouldn't survive the fork either.
+
+os.environ.setdefault("WARMUP_MODE", "preload")
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+wsgi_app = "server:app"
+preload_app = True
+
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))  # long enough for a full completion stream
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+accesslog = "-"
+
+# Each worker thread holds at most one OpenAI stream at a time
+os.environ.setdefault("OPENAI_MAX_CONNECTIONS", str(threads))
+os.environ.setdefault("OPENAI_MAX_KEEPALIVE_CONNECTIONS", str(threads))
+
+# A request waiting for a completion slot (admission.py) holds a worker thread too, so the
+# limit has to sit below the thread count for the fast 503 to ever trigger; otherwise extra
+# requests just wait for a free thread. Two threads stay free for rejections, cache hits and
+# health checks; with no spare threads there is nothing to queue in.
+os.environ.setdefault("ADMISSION_MAX_CONCURRENCY", str(max(1, threads - 2)))
+os.environ.setdefault("ADMISSION_QUEUE_SIZE", "0")
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach so gc passes in the
+    # workers don't touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from data_collection.tools import data_manager
+    from data_collection.tools.embedding_service import configure_torch_threads
+    import lifecycle
+    data_manager.reset_after_fork()
+    configure_torch_threads()
+    if os.environ["WARMUP_MODE"] == "preload":
+        lifecycle.warm_up()
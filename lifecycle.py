@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+from data_collection.tools import data_manager
+from data_collection.tools import reranker
+from data_collection.tools import token_counter
+
+# Startup lifecycle for the server: load the embedding model, index client and tokenizer,
+# then run a warm-up encode and vector query so the first real request doesn't pay
+# first-inference overhead. /ready reports ready only after warm-up finishes.
+#
+# WARMUP_MODE: "background" (default) warms up in a thread while the server starts
+# accepting requests, "blocking" warms up before the app is returned, "preload" only loads
+# the models and index client (a pre-forking master; each worker then runs the warm-up
+# inference itself, see gunicorn.conf.py), "off" skips it and everything loads lazily on
+# first use.
+
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "When is the add/drop deadline at Drexel?")
+
+startup_timings = {}  # phase -> seconds
+startup_error = None
+ready_event = threading.Event()
+_warmup_started = threading.Lock()
+
+
+def _timed(phase, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    startup_timings[phase] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def warm_up(inference=True):
+    """
+    Load the models and index client and, with inference, run the warm-up encode, query and
+    rerank. Inference must not run in a process that forks afterwards: torch's OpenMP
+    thread pool doesn't survive a fork and the workers could hang on their first encode.
+    """
+    global startup_error
+    start = time.perf_counter()
+    try:
+        model = _timed("load_embedding_model", data_manager.get_embedding_model)
+        index = _timed("open_index", data_manager.get_index)
+        _timed("load_tokenizer", token_counter.get_encoding)  # tiktoken downloads/parses its BPE file on first use
+        rerank_model = _timed("load_rerank_model", reranker.get_model) if reranker.RERANK_ENABLED else None
+        if not inference:
+            startup_timings["preload"] = round(time.perf_counter() - start, 4)
+            print(f"Models loaded, warm-up inference deferred: {startup_timings}")
+            return
+        vector = _timed("warmup_encode", model.encode, WARMUP_QUERY)
+        _timed("warmup_vector_query", index.query, vector=vector.tolist(), top_k=1, include_metadata=False)
+        if rerank_model is not None:
+            _timed("warmup_rerank", rerank_model.predict, [(WARMUP_QUERY, WARMUP_QUERY)], show_progress_bar=False)
+        startup_timings["total"] = round(time.perf_counter() - start, 4)
+        ready_event.set()
+        print(f"Warm-up finished: {startup_timings}")
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Warm-up failed: {e}")
+
+
+def start(mode=WARMUP_MODE):
+    """Kick off warm-up once per process according to mode."""
+    if not _warmup_started.acquire(blocking=False):
+        return
+    if mode == "blocking":
+        warm_up()
+    elif mode == "preload":
+        warm_up(inference=False)
+    elif mode == "background":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        ready_event.set()
+
+
+def readiness():
+    """Returns (is_ready, body) for the /ready endpoint."""
+    return ready_event.is_set(), {
+        "ready": ready_event.is_set(),
+        "startup_timings": startup_timings,
+        "error": startup_error,
+    }
@@ -0,0 +1,198 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Minimal Prometheus-style metrics (histograms, gauges, counters) rendered in the text
+# exposition format on /metrics. Values are per process.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+_registry = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines += self._samples()
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, description):
+        super().__init__(name, description)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, description):
+        super().__init__(name, description)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# /query metrics
+query_stage_seconds = Histogram("dragongpt_query_stage_seconds", "Time spent in each /query stage")
+query_ttft_seconds = Histogram("dragongpt_query_time_to_first_token_seconds", "Time from request start to the first streamed token")
+query_tokens_per_second = Histogram("dragongpt_query_tokens_per_second", "Streamed completion tokens per second", RATE_BUCKETS)
+inflight_streams = Gauge("dragongpt_inflight_streams", "Completion streams currently open")
+inflight_streams.set(0)
+requests_total = Counter("dragongpt_requests_total", "Requests by route and outcome")
+
+# Admission control (admission.py)
+admission_active = Gauge("dragongpt_admission_active_completions", "Upstream completions currently admitted")
+admission_active.set(0)
+admission_queue_depth = Gauge("dragongpt_admission_queue_depth", "Requests waiting for a completion slot")
+admission_queue_depth.set(0)
+admission_wait_seconds = Histogram("dragongpt_admission_wait_seconds", "Time spent waiting for a completion slot")
+admission_rejected_total = Counter("dragongpt_admission_rejected_total", "Requests shed by admission control, by reason")
+
+# Hedged and fallback completions (completion_dispatcher.py)
+llm_attempts_total = Counter("dragongpt_llm_attempts_total", "Completion requests sent upstream, by kind (primary, hedge, fallback)")
+llm_hedges_total = Counter("dragongpt_llm_hedges_total", "Hedge requests started because the first token was late")
+llm_hedges_skipped_total = Counter("dragongpt_llm_hedges_skipped_total", "Hedges not sent because admission was near capacity")
+llm_wins_total = Counter("dragongpt_llm_wins_total", "Completions streamed to the client, by the kind of request that won")
+llm_attempt_errors_total = Counter("dragongpt_llm_attempt_errors_total", "Failed completion requests, by kind (timeout: no token in time)")
+llm_first_token_seconds = Histogram("dragongpt_llm_first_token_seconds", "Time from sending the winning request to its first token, by kind")
+
+
+class QueryTimer:
+    """Collects stage timings for one /query request and records them when it finishes."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.tokens = 0
+        self.stream_start = None
+        self.first_token_at = None
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, timings):
+        """Merge timings reported by other code (e.g. data_manager.retrieve), ignoring flags."""
+        for name, seconds in timings.items():
+            if isinstance(seconds, float):
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def stream_started(self):
+        self.stream_start = time.perf_counter()
+        inflight_streams.inc()
+
+    def token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def finish(self, outcome="ok"):
+        if self.finished:
+            return
+        self.finished = True
+        end = time.perf_counter()
+        if self.stream_start is not None:
+            inflight_streams.dec()
+            if self.first_token_at is not None:
+                self.stages["openai_ttft"] = self.first_token_at - self.stream_start
+                self.stages["streaming"] = end - self.first_token_at
+                query_ttft_seconds.observe(self.first_token_at - self.start)
+                if end > self.first_token_at and self.tokens > 1:
+                    query_tokens_per_second.observe(self.tokens / (end - self.first_token_at))
+        self.stages["total"] = end - self.start
+        for name, seconds in self.stages.items():
+            query_stage_seconds.observe(seconds, stage=name)
+        requests_total.inc(route="/query", outcome=outcome)
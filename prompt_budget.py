@@ -0,0 +1,66 @@
+import os
+from functools import lru_cache
+from data_collection.tools.token_counter import count_tokens, truncate_to_tokens
+
+# Token budget for the /query prompt.
+#
+# Everything sent to the model is counted with the model's own encoding and has to fit in
+# PROMPT_TOKEN_BUDGET tokens. The fixed parts (system prompt, template, instructions,
+# output format) are counted once per text and cached. The query is capped at
+# QUERY_MAX_TOKENS, the history gives up whole lines from its oldest end when room is
+# short, and whatever is left goes to retrieved context (at least MIN_CONTEXT_TOKENS).
+# Context is trimmed by dropping whole sections in rank order, never mid-chunk.
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 12000))
+QUERY_MAX_TOKENS = int(os.getenv("QUERY_MAX_TOKENS", 1000))
+MIN_CONTEXT_TOKENS = int(os.getenv("MIN_CONTEXT_TOKENS", 1000))
+MESSAGE_OVERHEAD_TOKENS = 11  # chat format tokens for the system + user messages and the reply priming
+SECTION_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=256)
+def static_tokens(text):
+    """Token count of a prompt part that rarely changes (registry text, keyed by content)."""
+    return count_tokens(text)
+
+
+def trim_history(history, max_tokens):
+    """Drop whole lines from the start of history (oldest first) until it fits in max_tokens."""
+    if count_tokens(history) <= max_tokens:
+        return history
+    lines = history.splitlines(keepends=True)
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        tokens = count_tokens(line)
+        if used + tokens > max_tokens:
+            break
+        kept.append(line)
+        used += tokens
+    return "".join(reversed(kept))
+
+
+def plan(system_prompt, template, instructions, output_format, history, query, total=PROMPT_TOKEN_BUDGET):
+    """
+    Returns {"history", "query", "context_tokens"}: the history and query to put in the
+    prompt and how many tokens are left for retrieved context.
+    """
+    fixed = (MESSAGE_OVERHEAD_TOKENS + static_tokens(system_prompt) + static_tokens(template)
+             + static_tokens(instructions) + static_tokens(output_format))
+    query = truncate_to_tokens(query, QUERY_MAX_TOKENS)
+    available = total - fixed - count_tokens(query)
+    history = trim_history(history, max(0, available - MIN_CONTEXT_TOKENS))
+    return {"history": history, "query": query, "context_tokens": max(0, available - count_tokens(history))}
+
+
+def fit_sections(sections, budget):
+    """Join whole sections in rank order while they fit in budget tokens; later ones are dropped."""
+    kept = []
+    separator_tokens = count_tokens(SECTION_SEPARATOR)
+    for section in sections:
+        tokens = count_tokens(section) + separator_tokens
+        if tokens > budget:
+            break
+        kept.append(section)
+        budget -= tokens
+    return SECTION_SEPARATOR.join(kept)
@@ -0,0 +1,62 @@
+import os
+import time
+import threading
+from string import Template
+
+# Prompt templates from the prompts/ directory, loaded once at startup.
+#
+# Each prompts/<name>.txt is available as registry.get("<name>") and, for files with
+# ${placeholders}, registry.render("<name>", **values). Files are re-read when their
+# mtime changes; mtimes are checked at most every PROMPT_RELOAD_INTERVAL seconds so the
+# request path normally does no file I/O.
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", "prompts")
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", 5))
+
+
+class PromptRegistry:
+    def __init__(self, directory=PROMPTS_DIR, reload_interval=PROMPT_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._prompts = {}  # name -> (mtime, text, Template)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Load new or modified prompt files and drop deleted ones."""
+        with self._lock:
+            prompts = {}
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(".txt"):
+                    continue
+                name = filename[:-len(".txt")]
+                path = os.path.join(self.directory, filename)
+                mtime = os.path.getmtime(path)
+                current = self._prompts.get(name)
+                if current is not None and current[0] == mtime:
+                    prompts[name] = current
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                prompts[name] = (mtime, text, Template(text))
+            self._prompts = prompts
+            self._checked_at = time.monotonic()
+
+    def _maybe_reload(self):
+        if self.reload_interval >= 0 and time.monotonic() - self._checked_at > self.reload_interval:
+            self.reload()
+
+    def get(self, name):
+        self._maybe_reload()
+        return self._prompts[name][1]
+
+    def render(self, name, **values):
+        self._maybe_reload()
+        return self._prompts[name][2].substitute(values)
+
+    def names(self):
+        return sorted(self._prompts)
+
+
+prompts = PromptRegistry()
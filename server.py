@@ -1,11 +1,25 @@
 import os
 from flask import Flask, request, jsonify, Response
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, DefaultHttpxClient
+import httpx
 import sys
 sys.path.append('./')
 from data_collection.tools import data_manager
-import ast
+from data_collection.tools import sufficiency_gate
+from data_collection.tools.context_assembler import CONTEXT_TOKEN_BUDGET
+from data_collection.tools.token_counter import count_tokens
+from answer_cache import answer_cache, replay_answer, exact_terms, ANSWER_CACHE_ENABLED
+from prompt_registry import prompts
+from completion_dispatcher import CompletionDispatcher, LLM_FALLBACK_BASE_URL, LLM_FALLBACK_API_KEY, LLM_HEDGE_MAX_LOAD
+from admission import completion_slots, client_rate_limiter, client_id, Rejected, ADMISSION_ENABLED
+from single_flight import query_flights, coalescing_key
+from conversation_history import ConversationHistory, HISTORY_SUMMARY_MAX_TOKENS
+import prompt_budget
+import lifecycle
+import metrics
+import re
+import time
 import logging
 
 
@@ -17,108 +31,275 @@ app.config['DEBUG'] = os.environ["DEBUG_FLASK"]
 from flask_cors import CORS
 CORS(app, origins=["http://localhost:3000", "https://drexelai.github.io"])
 
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+# HTTP connection pool for OpenAI calls, per process (gunicorn.conf.py sizes it to the worker's thread count)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 32))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 16))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 30))
 
-def check_rag_with_openai_api(RAG, query):
-    check_prompt = f"Does the following context answer the query?\n\nContext: {RAG}\n\nQuery: {query}\n\nAnswer with 'yes' or 'no' in lowercase only please."
-    check_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-                    {"role": "system", "content": "You are a helpful assistant that answers questions about Drexel University using the latest and most up to date information"},
-                    {"role": "user", "content":check_prompt}
-                ]
+def openai_http_limits():
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+
+client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=DefaultHttpxClient(limits=openai_http_limits()))
+
+# /query completions are hedged when the first token is slow and fall back to a secondary model/endpoint on errors
+fallback_client = None
+if LLM_FALLBACK_BASE_URL:
+    fallback_client = OpenAI(
+        api_key=LLM_FALLBACK_API_KEY or os.environ["OPENAI_API_KEY"],
+        base_url=LLM_FALLBACK_BASE_URL,
+        http_client=DefaultHttpxClient(limits=openai_http_limits())
     )
-    return check_response.choices[0].message.content
+
+# Hedge requests aren't admitted separately, so only send them while there is headroom
+def hedge_allowed():
+    return not ADMISSION_ENABLED or completion_slots.load() < LLM_HEDGE_MAX_LOAD
+
+completions = CompletionDispatcher(client, fallback_client, can_hedge=hedge_allowed)
+
+WEB_AUGMENTATION = os.getenv("WEB_AUGMENTATION", "false").lower() in ("1", "true", "yes")
+# Time allowed for retrieval (including optional reranking) before generation starts
+RETRIEVAL_BUDGET_SECONDS = float(os.getenv("RETRIEVAL_BUDGET_SECONDS", 1.0))
+
+lifecycle.start()
 
 def parse_urls_from_rag(RAG):
-    return [metadata['URL'] for metadata in [ast.literal_eval(d) for d in RAG.split("\n")] if 'URL' in metadata]
+    return re.findall(r"^Source: (\S+)$", RAG, flags=re.MULTILINE)
 
-# Improve the RAG by adding more information from the web if the initial RAG does not answer the query
-def improve_rag(RAG, query):
-    check_answer = check_rag_with_openai_api(RAG, query)
+# Improve the RAG by adding more information from the web if the initial RAG does not answer the query.
+# Whether it does is decided locally from the retrieval scores and query term coverage (sufficiency_gate.py).
+# Web results are added whole, best first, while they fit in token_budget (prompt_budget.py)
+def improve_rag(RAG, query, matches, token_budget=CONTEXT_TOKEN_BUDGET):
+    signals = sufficiency_gate.compute_signals(query, matches, RAG)
 
-    if check_answer.lower() != 'yes':
+    if not sufficiency_gate.is_sufficient(signals):
         urls = parse_urls_from_rag(RAG)
-        # RAG += data_manager.fetch_content_from_urls(urls)
-        search_results = data_manager.duckduckgo_search(query + " at Drexel University 2025")
-        # print(search_results)
-        for result in search_results:
-            # print("fetching info")
-            RAG += result["body"]
-            moreinfo = data_manager.fetch_content_from_urls(result["href"])
-            if result["href"] not in urls:
-                RAG += moreinfo + result["href"]
-                # print(result["href"])
-                # print(moreinfo)
-        if len(RAG) > 128000:
-            RAG = RAG[:128000]
+        # Search and page fetches run concurrently; anything slower than WEB_AUGMENT_DEADLINE is dropped
+        sections = data_manager.augment_with_web_sections(query + " at Drexel University 2025", exclude_urls=urls)
+        extra = prompt_budget.fit_sections(sections, token_budget - count_tokens(RAG))
+        if extra:
+            RAG = RAG + prompt_budget.SECTION_SEPARATOR + extra if RAG else extra
     return RAG
 
 @app.route("/")
 def test():
     return "Server is running"
 
+@app.route("/ready")
+def ready():
+    is_ready, body = lifecycle.readiness()
+    return jsonify(body), 200 if is_ready else 503
+
+# Older turns are folded into a rolling summary written by the model (conversation_history.py).
+# Summaries take a completion slot like /query does; when none is free the summary is skipped
+# (Rejected) and retried on a later turn
+def summarize_history(previous_summary, new_turns):
+    permit = completion_slots.acquire() if ADMISSION_ENABLED else None
+    try:
+        return _summarize_history(previous_summary, new_turns)
+    finally:
+        if permit is not None:
+            permit.release()
+
+def _summarize_history(previous_summary, new_turns):
+    return client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": prompts.get("history_summary_system")},
+            {"role": "user", "content": prompts.render(
+                "history_summary_user",
+                summary=previous_summary or "(none yet)",
+                turns=new_turns,
+                max_words=HISTORY_SUMMARY_MAX_TOKENS * 3 // 4
+            )}
+        ],
+        max_tokens=HISTORY_SUMMARY_MAX_TOKENS
+    ).choices[0].message.content or ""
+
+conversation_history = ConversationHistory(summarize_history)
+
 def reformat_chat_data(chat_data):
-    reformatted_data = []
-    if not chat_data:
-        return ""
-    for entry in chat_data:
-        speaker = "User" if entry['isUser'] else "Bot"
-        reformatted_data.append(f"{speaker}: {entry['text']}\n")
-    return "".join(reformatted_data)
+    return conversation_history.render(chat_data)
+
+# Request building shared by the Flask routes below and the async app in asgi_server.py
+def lookup_cached_answer(query, reformatted_chat):
+    """Returns (cached_answer, cache_key); pass cache_key to answer_cache.store once the answer is complete."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    cache_key = (data_manager.embed_query(query), reformatted_chat, data_manager.get_index().version(), exact_terms(query))
+    return answer_cache.lookup(*cache_key), cache_key
+
+def build_query_messages(query, reformatted_chat, timer=None):
+    timer = timer or metrics.QueryTimer()
+    # Split the prompt's token budget between history, query and retrieved context
+    with timer.stage("prompt_budget"):
+        system_prompt = prompts.get("system")
+        instructions = prompts.get("instructions")
+        output_format = prompts.get("output_format")
+        budget = prompt_budget.plan(system_prompt, prompts.get("query_user"), instructions, output_format, reformatted_chat, query)
+    context_tokens = min(CONTEXT_TOKEN_BUDGET, budget["context_tokens"])
+    retrieval = data_manager.retrieve(query, deadline=time.monotonic() + RETRIEVAL_BUDGET_SECONDS, token_budget=context_tokens)
+    timer.add(retrieval["timings"])
+    RAG = retrieval["context"]
+    if WEB_AUGMENTATION and not retrieval["structured"]:
+        with timer.stage("web_augmentation"):
+            RAG = improve_rag(RAG, query, retrieval["matches"], budget["context_tokens"])
+    with timer.stage("prompt_build"):
+        user_prompt = prompts.render(
+            "query_user",
+            history=budget["history"],
+            context=RAG,
+            instructions=instructions,
+            query=budget["query"],
+            output_format=output_format
+        )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def summarize_messages(message):
+    return [
+        {"role": "system", "content": prompts.get("summarize_system")},
+        {"role": "user", "content": prompts.render("summarize_user", message=message)}
+    ]
+
+def blackboard_messages():
+    return [
+        {"role": "system", "content": prompts.get("blackboard_system")},
+        {"role": "user", "content": prompts.render("blackboard_user", assignments=prompts.get("blackboard_assignments"))}
+    ]
+
+@app.route("/metrics")
+def get_metrics():
+    return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/query", methods=["POST"])
 def query_llm():
+    timer = metrics.QueryTimer()
+    flight = None
+    permit = None
     try:
+        client_rate_limiter.check(client_id(request.headers, request.remote_addr))
         data = request.get_json()
         query = data.get("query")
 
         priorConversation = data.get("priorConversation")
-        reformatted_chat = reformat_chat_data(priorConversation)
+        with timer.stage("chat_reformat"):
+            reformatted_chat = reformat_chat_data(priorConversation)
 
         if not query:
+            timer.finish("bad_request")
             return jsonify({"detail": "Query is required"}), 400
 
-        RAG = data_manager.query_from_index(query)
-        #RAG = improve_rag(RAG, query)
-        system_prompt = open(os.path.join("prompts", "system.txt"), 'r').read()
-        instructions = open(os.path.join("prompts", "instructions.txt"), 'r').read()
-        output_format = "\nPlease answer only in a couple sentences and render the entire response in markdown but organize the code using level 2 headings and paragraphs. Feel free to use lists and other markdown features"
-        user_prompt = f'Use any information from the current conversation history where needed:\n{reformatted_chat}\n\n{RAG}\n\n {instructions} \n\n{query} + {output_format}'
+        # Identical history-free queries already in flight share that request's retrieval and stream
+        flight_key = coalescing_key(query, priorConversation)
+        if flight_key is not None:
+            flight, is_leader = query_flights.join(flight_key)
+            if not is_leader:
+                return Response(follow_flight(flight, timer), content_type="text/plain-text")
+
+        with timer.stage("answer_cache_lookup"):
+            cached_answer, cache_key = lookup_cached_answer(query, reformatted_chat)
+        if cached_answer is not None:
+            timer.finish("cache_hit")
+            if flight is not None:
+                flight.publish(cached_answer)
+                flight.finish()
+            return Response(replay_answer(cached_answer), content_type="text/plain-text")
+
+        permit = acquire_completion_slot(timer)
+        messages = build_query_messages(query, reformatted_chat, timer)
         def generate():
             full_content = ""
-            stream = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=True
-            )
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    content = chunk.choices[0].delta.content
-                    if content : #Error handling for missing data
-                        full_content += content
-                        #print(content)  # Print the content for debugging purposes
-                        yield content
+            timer.stream_started()
+            outcome = "error"
+            error = "upstream stream failed"
+            client_gone = False
+            contents = completions.stream(messages)
+            try:
+                for content in contents:
+                    timer.token()
+                    full_content += content
+                    if flight is not None:
+                        flight.publish(content)
+                    #print(content)  # Print the content for debugging purposes
+                    yield content
+                outcome = "ok"
+            except GeneratorExit:
+                client_gone = True
+                raise
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                if flight is not None:
+                    # Followers still need the rest of the answer if this client went away;
+                    # an upstream failure is passed on to them instead
+                    try:
+                        if client_gone and flight.followers:
+                            for content in contents:
+                                full_content += content
+                                flight.publish(content)
+                            outcome = "ok"
+                            # The generator is exiting, so the store below won't run
+                            if cache_key is not None:
+                                answer_cache.store(*cache_key, full_content)
+                    except Exception as e:
+                        error = str(e)
+                    finally:
+                        flight.finish(None if outcome == "ok" else error)
+                timer.finish(outcome)
             # print(f"Response to question \"{query}\" has been generated")
+            if cache_key is not None and outcome == "ok":
+                answer_cache.store(*cache_key, full_content)
 
-        return Response(generate(), content_type="text/plain-text")
+        response = Response(generate(), content_type="text/plain-text")
+        if permit is not None:
+            response.call_on_close(permit.release)
+        return response
 
+    except Rejected as e:
+        timer.finish(e.reason)
+        if flight is not None:
+            flight.finish(e.reason)
+        return jsonify(e.body()), e.status, e.headers()
     except Exception as e:
         print(e)
+        timer.finish("error")
+        if permit is not None:
+            permit.release()
+        if flight is not None:
+            flight.finish(str(e))
         return jsonify({"answer": str(e)}), 500
 
+# Upstream completions are bounded per process; excess requests queue briefly or get a 503 (admission.py)
+def acquire_completion_slot(timer):
+    if not ADMISSION_ENABLED:
+        return None
+    with timer.stage("admission_wait"):
+        return completion_slots.acquire()
+
+def follow_flight(flight, timer):
+    timer.stream_started()
+    outcome = "error"
+    try:
+        for content in flight.follow():
+            timer.token()
+            yield content
+        outcome = "coalesced"
+    finally:
+        timer.finish(outcome)
+
 @app.route("/summarize-convo", methods=["POST"])
 def summarize_convo():
     firstMessage = request.get_json()["message"]
     chatrename = client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a message summarizer who summarizes a given message into 2-3 words"},
-                {"role": "user", "content": firstMessage + "\n\nSummarize this message into 2-3 words and just return the message"}
-            ]
+            messages=summarize_messages(firstMessage)
         ).choices[0].message.content
 
     return {"messageSummary": chatrename}
@@ -127,16 +308,10 @@ def summarize_convo():
 @app.route("/blackboard", methods=["POST"])
 def query_blackboard():
 
-    response2 = "Your assignments this week: ENTP 205 Ready, Set, Fail: Discussion board post on business idea due Friday 11:59PM. ENTP 325 Early Stage Venture Funding: Cap table assignment due Wednesday 11:59PM. MATH 121: Problem Set 4 pages 79-81 textbook due Thursday before class. Suggested Time Budgeting Plan: Monday (Today) – Focus: Start and finish Cap Table Assignment for ENTP 325. Time Required: 2-3 hours (including research and calculations). Goal: Complete most, if not all, of this assignment since it’s due soonest. Tuesday – Focus: Finish up the Cap Table Assignment if any parts remain. Time Required: 1 hour (if needed for final touch-ups). Begin: MATH 121 Problem Set 4 to avoid rushing before class on Thursday. Time Required: 1-2 hours. Goal: Get at least halfway through the problem set. Wednesday – Focus: Complete the remaining part of MATH 121 Problem Set 4. Time Required: 1-2 hours. Goal: Finish the problem set and review answers if time allows. Thursday – Focus: Write the Discussion Board Post for ENTP 205. Time Required: 1-2 hours for writing and revising. Goal: Complete the post in time for submission on Friday. This plan ensures you’re prioritizing based on due dates and spreading out your workload for a balanced approach."
-
-
     def generateblackboard():
         stream = client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "you will repeat back to me what I say"},
-                {"role": "user", "content": response2 + "\n\n\norganize this more nicely"}
-            ],
+            messages=blackboard_messages(),
             stream=True
         )
         for chunk in stream:
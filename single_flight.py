@@ -0,0 +1,119 @@
+import os
+import asyncio
+import threading
+from data_collection.tools.embedding_cache import normalize_query
+
+# Request coalescing (single-flight) for /query.
+#
+# Concurrent requests with the same normalized query and no conversation history share one
+# retrieval and one OpenAI stream. The first request (the leader) does the work and
+# publishes each streamed chunk to a Flight; every other request follows the Flight,
+# starting with the chunks buffered so far, so clients that join mid-stream still receive
+# the whole answer. A Flight is removed once its stream finishes; later requests start a
+# new one (and normally hit the answer cache instead).
+
+QUERY_COALESCING = os.getenv("QUERY_COALESCING", "true").lower() in ("1", "true", "yes")
+
+
+def coalescing_key(query, chat_data):
+    """Key shared by requests that can be coalesced, or None when this one can't."""
+    if not QUERY_COALESCING or chat_data or not query:
+        return None
+    return normalize_query(query)
+
+
+class Flight:
+    def __init__(self, on_finish=None):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self._on_finish = on_finish
+        self._cond = threading.Condition()
+        self._event = None  # asyncio.Event for async followers, created on first use
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+        if self._event is not None:
+            self._event.set()
+
+    def finish(self, error=None):
+        if self._on_finish is not None:
+            self._on_finish()
+        with self._cond:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+        if self._event is not None:
+            self._event.set()
+
+    def follow(self, timeout=120):
+        """Yield every chunk from the beginning, blocking until the leader publishes more."""
+        position = 0
+        while True:
+            with self._cond:
+                if position >= len(self.chunks) and not self.done:
+                    if not self._cond.wait_for(lambda: position < len(self.chunks) or self.done, timeout):
+                        raise TimeoutError("Timed out waiting for the coalesced response")
+                chunks = self.chunks[position:]
+                done = self.done
+            position += len(chunks)
+            yield from chunks
+            if done and position >= len(self.chunks):
+                if self.error is not None:
+                    raise RuntimeError(f"Coalesced request failed: {self.error}")
+                return
+
+    async def afollow(self):
+        """follow() for ASGI, where the leader publishes from the same event loop."""
+        if self._event is None:
+            self._event = asyncio.Event()
+        position = 0
+        while True:
+            chunks = self.chunks[position:]
+            done = self.done
+            position += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if done and position >= len(self.chunks):
+                if self.error is not None:
+                    raise RuntimeError(f"Coalesced request failed: {self.error}")
+                return
+            if position >= len(self.chunks):
+                self._event.clear()
+                await self._event.wait()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key):
+        """Returns (flight, is_leader). The leader must call flight.finish() when done."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = Flight(on_finish=lambda: self._release(key, flight))
+            self._flights[key] = flight
+            return flight, True
+
+    def _release(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), "coalesced": self.coalesced}
+
+
+query_flights = SingleFlight()
@@ -0,0 +1,21 @@
+import pytest
+from admission import ClientRateLimiter, Rejected, client_id
+
+
+def test_client_id_ignores_forwarded_for_without_trusted_proxy():
+    assert client_id({"X-Forwarded-For": "1.2.3.4"}, "10.0.0.1", trusted_hops=0) == "10.0.0.1"
+
+
+def test_client_id_uses_entry_added_by_trusted_proxy():
+    headers = {"X-Forwarded-For": "1.2.3.4, 203.0.113.7:51234"}
+    assert client_id(headers, "10.0.0.1", trusted_hops=1) == "203.0.113.7"
+    assert client_id(headers, "10.0.0.1", trusted_hops=2) == "1.2.3.4"
+
+
+def test_spoofed_leading_entry_does_not_reset_bucket():
+    limiter = ClientRateLimiter(rate=0.001, burst=2)
+    for i in range(2):
+        limiter.check(client_id({"X-Forwarded-For": f"1.2.3.{i}, 203.0.113.7"}, "10.0.0.1", trusted_hops=1))
+    with pytest.raises(Rejected) as rejected:
+        limiter.check(client_id({"X-Forwarded-For": "1.2.3.99, 203.0.113.7"}, "10.0.0.1", trusted_hops=1))
+    assert rejected.value.status == 429
@@ -0,0 +1,27 @@
+import numpy as np
+from answer_cache import AnswerCache, exact_terms
+
+VECTOR = np.ones(384, dtype=np.float32)
+
+
+def test_exact_terms_normalizes_course_codes():
+    assert exact_terms("When does CS 171 meet?") == exact_terms("when does cs-171 meet") == {"CS171"}
+
+
+def test_hit_for_same_course():
+    cache = AnswerCache(max_size=4)
+    cache.store(VECTOR, "", "v1", exact_terms("Who teaches CS 171?"), "Professor A")
+    assert cache.lookup(VECTOR, "", "v1", exact_terms("who teaches CS171")) == "Professor A"
+
+
+def test_no_hit_for_different_course_number():
+    cache = AnswerCache(max_size=4)
+    cache.store(VECTOR, "", "v1", exact_terms("Who teaches CS 171?"), "Professor A")
+    # Identical embeddings: only the course number tells the queries apart
+    assert cache.lookup(VECTOR, "", "v1", exact_terms("Who teaches CS 172?")) is None
+
+
+def test_no_hit_for_different_crn():
+    cache = AnswerCache(max_size=4)
+    cache.store(VECTOR, "", "v1", exact_terms("When does CRN 41234 meet?"), "Mondays")
+    assert cache.lookup(VECTOR, "", "v1", exact_terms("When does CRN 41235 meet?")) is None
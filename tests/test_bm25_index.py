@@ -0,0 +1,24 @@
+from data_collection.tools.bm25_index import BM25Index, reciprocal_rank_fusion
+
+# The same chunk id in the major and minor namespaces (as with collegeofbusiness_chunk_0)
+MAJOR_CHUNK = {"id": "collegeofbusiness_chunk_0",
+               "metadata": {"source": "major", "major_name": "Accounting", "Text_Chunk": "accounting major requirements"}}
+MINOR_CHUNK = {"id": "collegeofbusiness_chunk_0",
+               "metadata": {"source": "minor", "minor_name": "Accounting", "Text_Chunk": "accounting minor requirements"}}
+
+
+def test_colliding_ids_from_two_namespaces_are_both_indexed(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25"))
+    index.add([MAJOR_CHUNK])
+    index.add([MINOR_CHUNK])
+    index.build()
+    sources = {match["metadata"]["source"] for match in index.search("accounting requirements", top_k=5)}
+    assert sources == {"major", "minor"}
+
+
+def test_fusion_keeps_colliding_ids_from_two_namespaces_apart():
+    dense = [dict(MAJOR_CHUNK, score=0.9), dict(MINOR_CHUNK, score=0.8)]
+    lexical = [dict(MINOR_CHUNK, score=3.0)]
+    fused = reciprocal_rank_fusion([dense, lexical], top_k=5)
+    assert len(fused) == 2
+    assert fused[0]["metadata"]["source"] == "minor"
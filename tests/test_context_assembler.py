@@ -0,0 +1,32 @@
+from data_collection.tools import context_assembler, token_counter
+
+
+class _CharEncoding:
+    """One token per character, so tests don't need the tiktoken download."""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def _match(header, text, chunk_index=0):
+    return {"metadata": {"source": "official_page", "Header": header, "Text_Chunk": text,
+                         "Chunk_Index": chunk_index, "URL": f"https://drexel.edu/{header}"}}
+
+
+def test_oversized_top_document_is_skipped(monkeypatch):
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model=None: _CharEncoding())
+    matches = [_match("big", "x" * 1000), _match("small", "the add/drop deadline")]
+    context = context_assembler.assemble_context(matches, token_budget=200)
+    assert "big" not in context
+    assert "the add/drop deadline" in context
+
+
+def test_partial_document_keeps_whole_leading_chunks(monkeypatch):
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model=None: _CharEncoding())
+    matches = [_match("page", "a" * 60, 0), _match("page", "b" * 60, 1), _match("page", "c" * 60, 2)]
+    context = context_assembler.assemble_context(matches, token_budget=200)
+    assert "a" * 60 in context and "b" * 60 in context
+    assert "c" not in context.replace("Source", "")
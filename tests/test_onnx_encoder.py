@@ -0,0 +1,15 @@
+import os
+import pytest
+from data_collection.tools import onnx_encoder
+
+# Needs torch and the exported int8 model (python -m data_collection.tools.onnx_encoder export)
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+if not os.path.exists(os.path.join(onnx_encoder.ONNX_MODEL_DIR, onnx_encoder.ONNX_MODEL_FILE)):
+    pytest.skip("ONNX model has not been exported", allow_module_level=True)
+
+
+def test_int8_model_matches_torch_embeddings():
+    similarities = onnx_encoder.parity_similarities()
+    assert similarities.min() >= onnx_encoder.PARITY_TOLERANCE
@@ -0,0 +1,51 @@
+from data_collection.tools import page_cache, web_fetcher
+
+URL = "https://drexel.edu/registrar/calendar"
+
+
+class _Response:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+def _cache(tmp_path, monkeypatch):
+    cache = page_cache.PageCache(path=str(tmp_path / "pages.sqlite3"), ttl=0)
+    monkeypatch.setattr(page_cache, "get_page_cache", lambda: cache)
+    return cache
+
+
+def test_revalidation_server_error_keeps_previous_entry(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch)
+    cache.put(URL, "Fall term starts September 22", etag='"v1"')
+    checked_before = cache.get(URL)["fetched_at"]
+
+    requests_headers = []
+
+    def get(url, timeout=None, headers=None):
+        requests_headers.append(headers)
+        return _Response(503)
+
+    monkeypatch.setattr(web_fetcher.session, "get", get)
+    assert web_fetcher.fetch_page_text(URL) == "Fall term starts September 22"
+    assert requests_headers == [{"If-None-Match": '"v1"'}]
+
+    entry = cache.get(URL)
+    assert entry["ok"] and entry["text"] == "Fall term starts September 22" and entry["etag"] == '"v1"'
+    assert entry["fetched_at"] >= checked_before
+
+
+def test_not_modified_serves_cached_text(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch)
+    cache.put(URL, "Fall term starts September 22", etag='"v1"')
+    monkeypatch.setattr(web_fetcher.session, "get", lambda url, timeout=None, headers=None: _Response(304))
+    assert web_fetcher.fetch_page_text(URL) == "Fall term starts September 22"
+    assert cache.revalidated == 1
+
+
+def test_error_without_previous_entry_is_cached_as_failure(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch)
+    monkeypatch.setattr(web_fetcher.session, "get", lambda url, timeout=None, headers=None: _Response(500))
+    assert web_fetcher.fetch_page_text(URL) == ""
+    assert cache.get(URL)["ok"] is False